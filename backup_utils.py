@@ -1,10 +1,19 @@
 # -*- coding: utf-8 -*-
 
+import argparse
+import base64
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import hashlib
 import subprocess
+import os
 import os.path
+import shutil
 import smtplib
-from email.mime.application import MIMEApplication
-from email.mime.multipart import MIMEMultipart
+import tempfile
+import time
+import uuid
 from email.mime.text import MIMEText
 import email.utils
 
@@ -20,6 +29,7 @@ SETTINGS_LOCAL = dict(
    locale='ru_RU.UTF-8',
    psql=os.path.join(LOCAL_PATH, 'psql'),
    pg_dump=os.path.join(LOCAL_PATH, 'pg_dump'),
+   pg_restore=os.path.join(LOCAL_PATH, 'pg_restore'),
    createdb=os.path.join(LOCAL_PATH, 'createdb'),
 )
 
@@ -29,11 +39,22 @@ SETTINGS_DEV = dict(
    locale='ru_RU.UTF-8',
    psql='psql',
    pg_dump='pg_dump',
+   pg_restore='pg_restore',
    createdb='createdb',
 )
 
 SETTINGS = SETTINGS_DEV
 
+DUMP_FILE = '/var/lib/postgresql/dump.backup'
+DUMP_FORMATS = ('custom', 'directory')
+COMPRESS = 6
+CHUNK_SIZE = 1024 * 1024
+# Base64 turns every 57 bytes into one 76-character line.
+ATTACHMENT_CHUNK_SIZE = 57 * 16 * 1024
+CHECKSUMS_FILE = 'SHA256SUMS'
+ARCHIVE_SIGNATURE = b'PGDMP'
+RESTORE_JOBS = 4
+
 
 def create_db():
     command = ('{createdb} {dbname} '
@@ -45,56 +66,290 @@ def create_db():
     subprocess.check_call(command, shell=True)
 
 
-def restore(infile, single_transaction=True):
-    # --set ON_ERROR_STOP=on
-    command = '{psql} {dbname} < {infile} '.format(infile=infile, **SETTINGS)
+def _read_chunks(f, size=CHUNK_SIZE):
+    return iter(functools.partial(f.read, size), b'')
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in _read_chunks(f):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def backup(outfile, format='custom', jobs=None, compress=COMPRESS):
+    """
+    The dump is written next to ``outfile`` and replaces it only once
+    complete, so a failed run keeps the previous backup.
+    """
+    if format not in DUMP_FORMATS:
+        raise ValueError('Unknown dump format: {}'.format(format))
+    if jobs and format != 'directory':
+        raise ValueError('Parallel dumps need the directory format.')
+
+    args = [SETTINGS['pg_dump'], SETTINGS['dbname'],
+            '--format={}'.format(format),
+            '--compress={}'.format(compress),
+            '--encoding=UTF8']
+    if jobs:
+        args.append('--jobs={}'.format(jobs))
+    partial = outfile + '.part'
+    # pg_dump writes the file itself rather than to a pipe: only a seekable
+    # custom-format archive records data offsets, which pg_restore needs to
+    # load tables in parallel.
+    args.append('--file={}'.format(partial))
+    _remove(partial)
+    try:
+        subprocess.check_call(args)
+        if format == 'directory':
+            names = sorted(os.listdir(partial))
+            with open(os.path.join(partial, CHECKSUMS_FILE), 'w') as f:
+                for name in names:
+                    checksum = sha256_file(os.path.join(partial, name))
+                    f.write('{}  {}\n'.format(checksum, name))
+        else:
+            checksum = sha256_file(partial)
+            with open(outfile + '.sha256', 'w') as f:
+                f.write('{}  {}\n'.format(checksum, os.path.basename(outfile)))
+        _remove(outfile)
+        os.replace(partial, outfile)
+    except BaseException:
+        _remove(partial)
+        raise
+
+
+def verify_backup(path):
+    if os.path.isdir(path):
+        directory, checksums = path, os.path.join(path, CHECKSUMS_FILE)
+    else:
+        directory, checksums = os.path.dirname(path), path + '.sha256'
+    with open(checksums) as f:
+        for line in f:
+            expected, name = line.rstrip('\n').split('  ', 1)
+            if sha256_file(os.path.join(directory, name)) != expected:
+                raise ValueError('Checksum mismatch: {}'.format(name))
+
+
+def detect_format(path):
+    if os.path.isdir(path):
+        return 'directory'
+    with open(path, 'rb') as f:
+        if f.read(len(ARCHIVE_SIGNATURE)) == ARCHIVE_SIGNATURE:
+            return 'custom'
+    return 'plain'
+
+
+def restore(infile, dbname=None, jobs=RESTORE_JOBS, no_owner=False,
+            single_transaction=True):
+    dbname = dbname or SETTINGS['dbname']
+    format = detect_format(infile)
+    checksums = (os.path.join(infile, CHECKSUMS_FILE) if format == 'directory'
+                 else infile + '.sha256')
+    if os.path.exists(checksums):
+        verify_backup(infile)
+    if format == 'plain':
+        restore_plain(infile, dbname, single_transaction=single_transaction)
+        return OrderedDict(), OrderedDict()
+    return restore_archive(infile, dbname, jobs=jobs, no_owner=no_owner)
+
+
+def restore_plain(infile, dbname, single_transaction=True):
+    args = [SETTINGS['psql'], '--dbname={}'.format(dbname),
+            '--set=ON_ERROR_STOP=on', '--quiet', '--file={}'.format(infile),
+            '--output={}'.format(os.devnull)]
     if single_transaction:
-        command += '--single-transaction '
-    subprocess.check_call(command, shell=True)
+        args.append('--single-transaction')
+    subprocess.check_call(args)
 
 
-def backup(outfile):
-    # Only in PostgreSQL 9.6: '--if-exists'
-    command = ('{pg_dump} {dbname} '
-               '--file={outfile} '
-               '--encoding=UTF8 '
-               '--clean '
-               '--column-inserts ').format(outfile=outfile, **SETTINGS)
-    subprocess.check_call(command, shell=True)
+def _pg_restore(infile, dbname, *options):
+    args = [SETTINGS['pg_restore'], '--dbname={}'.format(dbname),
+            '--exit-on-error'] + list(options) + [infile]
+    subprocess.check_call(args)
+
+
+def _pg_restore_items(infile, dbname, items, *options):
+    with tempfile.NamedTemporaryFile('w', suffix='.list', delete=False) as f:
+        f.write(''.join(item + '\n' for item in items))
+    try:
+        _pg_restore(infile, dbname, '--use-list={}'.format(f.name), *options)
+    finally:
+        os.remove(f.name)
+
+
+def _list_archive(infile):
+    output = subprocess.check_output([SETTINGS['pg_restore'], '--list', infile])
+    return [line for line in output.decode('utf-8').splitlines()
+            if line.strip() and not line.startswith(';')]
+
+
+def _table_name(item):
+    # '3401; 1259 16390 TABLE DATA public pages owner'
+    schema, table = item.split(' TABLE DATA ', 1)[1].split()[:2]
+    return '{}.{}'.format(schema, table)
+
+
+def restore_archive(infile, dbname, jobs=RESTORE_JOBS, no_owner=False):
+    """
+    Restore a custom or directory dump with pg_restore in three steps:
+    the schema without indexes and constraints (pre-data), table data
+    loaded by ``jobs`` parallel workers, then indexes, constraints and
+    triggers built by ``jobs`` parallel workers (post-data).
+    """
+    options = ['--no-owner'] if no_owner else []
+    items = _list_archive(infile)
+    tables = [item for item in items if ' TABLE DATA ' in item]
+    rest = [item for item in items if ' TABLE DATA ' not in item]
+    steps = OrderedDict()
+    table_timings = OrderedDict()
+
+    def timed(func, *args):
+        started = time.monotonic()
+        func(*args)
+        return time.monotonic() - started
+
+    def restore_table(item):
+        return _table_name(item), timed(_pg_restore_items, infile, dbname, [item], *options)
+
+    steps['pre-data'] = timed(_pg_restore, infile, dbname, '--section=pre-data', *options)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for name, seconds in executor.map(restore_table, tables):
+            table_timings[name] = seconds
+    # Sequence values and large objects.
+    _pg_restore_items(infile, dbname, rest, '--section=data', *options)
+    steps['data'] = time.monotonic() - started
+
+    steps['post-data'] = timed(_pg_restore, infile, dbname, '--section=post-data',
+                               '--jobs={}'.format(jobs), *options)
+    return steps, table_timings
+
+
+def print_timings(steps, table_timings):
+    for name, seconds in steps.items():
+        print('{:<40} {:>10.2f} s'.format(name, seconds))
+    if table_timings:
+        print()
+        for name, seconds in sorted(table_timings.items(), key=lambda item: -item[1]):
+            print('{:<40} {:>10.2f} s'.format(name, seconds))
+
+
+def _iter_message(send_from, send_to, subject, text, attachment):
+    boundary = '=' * 15 + uuid.uuid4().hex
+    name = os.path.basename(attachment)
+    head = [
+        'From: {}'.format(send_from),
+        'To: {}'.format(email.utils.COMMASPACE.join(send_to)),
+        'Date: {}'.format(email.utils.formatdate(localtime=True)),
+        'Subject: {}'.format(subject),
+        'MIME-Version: 1.0',
+        'Content-Type: multipart/mixed; boundary="{}"'.format(boundary),
+        '',
+        '--{}'.format(boundary),
+        MIMEText(text).as_string(),
+        '--{}'.format(boundary),
+        'Content-Type: application/octet-stream; name="{}"'.format(name),
+        'Content-Transfer-Encoding: base64',
+        'Content-Disposition: attachment; filename="{}"'.format(name),
+        '',
+        '',
+    ]
+    yield smtplib.quotedata('\n'.join(head)).encode('ascii')
+    with open(attachment, 'rb') as f:
+        for chunk in _read_chunks(f, ATTACHMENT_CHUNK_SIZE):
+            # Base64 lines never start with a dot, no quoting needed.
+            yield base64.encodebytes(chunk).replace(b'\n', b'\r\n')
+    yield '--{}--\r\n'.format(boundary).encode('ascii')
+
+
+def _sendmail_streaming(smtp, send_from, send_to, chunks):
+    """
+    ``SMTP.sendmail`` that writes the message as it is produced
+    instead of building it in memory first.
+    """
+    smtp.ehlo_or_helo_if_needed()
+    code, response = smtp.mail(send_from)
+    if code != 250:
+        raise smtplib.SMTPSenderRefused(code, response, send_from)
+    for address in send_to:
+        code, response = smtp.rcpt(address)
+        if code not in (250, 251):
+            raise smtplib.SMTPRecipientsRefused({address: (code, response)})
+    code, response = smtp.docmd('data')
+    if code != 354:
+        raise smtplib.SMTPDataError(code, response)
+    for chunk in chunks:
+        smtp.send(chunk)
+    smtp.send(b'.\r\n')
+    code, response = smtp.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, response)
 
 
 def send_backup(send_to, dump_file):
     if not isinstance(send_to, (list, tuple)):
         send_to = [send_to]
+    if os.path.isdir(dump_file):
+        raise ValueError('Only single-file dumps can be attached.')
     send_from = config['DB_BACKUP_SEND_FROM']
     subject = 'Database Backup ({dbname})'.format(**SETTINGS)
     text = 'Full backup of database "{dbname}" attached.'.format(**SETTINGS)
+    with open(dump_file + '.sha256') as f:
+        text += '\n\nSHA-256: {}'.format(f.read().split()[0])
 
-    msg = MIMEMultipart()
-    msg['From'] = send_from
-    msg['To'] = email.utils.COMMASPACE.join(send_to)
-    msg['Date'] = email.utils.formatdate(localtime=True)
-    msg['Subject'] = subject
-
-    msg.attach(MIMEText(text))
-
-    with open(dump_file, 'rb') as dump:
-        name = os.path.basename(dump_file)
-        part = MIMEApplication(dump.read(), Name=name)
-        part['Content-Disposition'] = 'attachment; filename="{}"'.format(name)
-        msg.attach(part)
-
+    chunks = _iter_message(send_from, send_to, subject, text, dump_file)
+    smtp = smtplib.SMTP_SSL(config['DB_BACKUP_SMTP_HOST'],
+                            config['DB_BACKUP_SMTP_PORT'], timeout=10)
     try:
-        smtp = smtplib.SMTP_SSL(config['DB_BACKUP_SMTP_HOST'],
-                                config['DB_BACKUP_SMTP_PORT'], timeout=10)
-        smtp.login(config['DB_BACKUP_LOGIN'], config['DB_BACKUP_SMTP_PASSWORD'])
-        smtp.sendmail(SEND_FROM, send_to, msg.as_string())
+        smtp.login(config['DB_BACKUP_LOGIN'], config['DB_BACKUP_PASSWORD'])
+        _sendmail_streaming(smtp, send_from, send_to, chunks)
     finally:
         smtp.close()
 
 
+def main():
+    parser = argparse.ArgumentParser(description='Database backups.')
+    commands = parser.add_subparsers(dest='command')
+
+    backup_parser = commands.add_parser('backup', help='dump the database (default)')
+    backup_parser.add_argument('--file', default=DUMP_FILE)
+    backup_parser.add_argument('--format', choices=DUMP_FORMATS, default='custom')
+    backup_parser.add_argument('--jobs', type=int,
+                               help='parallel dump, directory format only')
+    backup_parser.add_argument('--compress', type=int, default=COMPRESS)
+    backup_parser.add_argument('--no-send', dest='send', action='store_false',
+                               help='do not email the dump')
+
+    restore_parser = commands.add_parser(
+        'restore', help='restore a dump of any format into an empty database')
+    restore_parser.add_argument('file')
+    restore_parser.add_argument('--dbname', help='database name or connection URI')
+    restore_parser.add_argument('--jobs', type=int, default=RESTORE_JOBS)
+    restore_parser.add_argument('--no-owner', action='store_true',
+                                help='do not restore object ownership')
+
+    args = parser.parse_args()
+    if args.command is None:
+        args = parser.parse_args(['backup'])
+
+    if args.command == 'backup':
+        backup(args.file, format=args.format, jobs=args.jobs, compress=args.compress)
+        if args.send:
+            send_backup(config['DB_BACKUP_SEND_TO'], args.file)
+    elif args.command == 'restore':
+        print_timings(*restore(args.file, dbname=args.dbname, jobs=args.jobs,
+                               no_owner=args.no_owner))
+
+
 if __name__ == '__main__':
     # This script should be launched from postgres user.
-    dump_file = '/var/lib/postgresql/dump.sql'
-    backup(dump_file)
-    send_backup(config['DB_BACKUP_SEND_TO'], dump_file)
+    main()
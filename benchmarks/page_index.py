@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Memory footprint and lookup latency of the in-memory page tree index.
+
+    python -m benchmarks.page_index
+"""
+
+import random
+import time
+import tracemalloc
+
+from page_index import PageIndex
+
+SIZES = (1000, 10000, 100000)
+LOOKUPS = 100000
+
+
+def generate_rows(size):
+    """
+    Rows shaped like the index query: main page, categories,
+    subcategories and services spread evenly between them.
+    """
+    rows = [(1, 'main', 'main', None, 0, True)]
+    n_categories = max(1, size // 100)
+    n_subcategories = max(1, size // 20)
+    ids = iter(range(2, size + 2))
+    categories = []
+    for n in range(n_categories):
+        id = next(ids)
+        categories.append(id)
+        rows.append((id, 'category-{}'.format(n), 'category', 1, n, True))
+    subcategories = []
+    for n in range(n_subcategories):
+        id = next(ids)
+        parent_id = categories[n % n_categories]
+        subcategories.append((id, parent_id))
+        rows.append((id, 'subcategory-{}'.format(n), 'subcategory', parent_id, n, True))
+    for n, id in enumerate(ids):
+        parent_id = subcategories[n % n_subcategories][0]
+        rows.append((id, 'service-{}'.format(n), 'service', parent_id, n, True))
+    return rows
+
+
+def urls(index, rows, count, seed=0):
+    rnd = random.Random(seed)
+    services = [row for row in rows if row[2] == 'service']
+    result = []
+    for _ in range(count):
+        node = index.get_by_id(rnd.choice(services)[0])
+        parent = index.get_by_id(node.parent_id)
+        grandparent = index.get_by_id(parent.parent_id)
+        result.append((grandparent.label, parent.label, node.label))
+    return result
+
+
+def run(sizes=SIZES, lookups=LOOKUPS):
+    results = []
+    for size in sizes:
+        rows = generate_rows(size)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        index = PageIndex.from_rows(rows)
+        build = time.perf_counter() - started
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        paths = urls(index, rows, lookups)
+        resolve = index.resolve
+        started = time.perf_counter()
+        for path in paths:
+            assert resolve(*path) is not None
+        lookup = (time.perf_counter() - started) / lookups
+        results.append((len(index), memory, build, lookup))
+    return results
+
+
+def main():
+    print('{:>8} {:>12} {:>10} {:>12}'.format('pages', 'memory, MiB', 'build, ms', 'lookup, us'))
+    for size, memory, build, lookup in run():
+        print('{:>8} {:>12.1f} {:>10.1f} {:>12.2f}'.format(
+            size, memory / 2 ** 20, build * 1000, lookup * 10 ** 6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Compares single-pass shortcode substitution with the old per-key loop.
+
+    python -m benchmarks.shortcodes
+"""
+
+import random
+import timeit
+
+from shortcodes import ShortcodeSnapshot
+
+SIZES = (10, 100, 1000)
+PARAGRAPHS = 200
+REPEAT = 5
+
+
+def replace_in_loop(values, text):
+    for key, value in values.items():
+        text = text.replace('[{}]'.format(key), value)
+    return text
+
+
+def generate_content(keys, paragraphs=PARAGRAPHS, seed=0):
+    rnd = random.Random(seed)
+    chunks = []
+    for n in range(paragraphs):
+        chunks.append(u'<p>Юридическая консультация, абзац {}. '
+                      u'Позвоните по телефону [{}] или приходите в офис [{}].</p>'
+                      .format(n, rnd.choice(keys), rnd.choice(keys)))
+    return u'\n'.join(chunks)
+
+
+def run(sizes=SIZES, repeat=REPEAT):
+    results = []
+    for size in sizes:
+        values = {'code-{}'.format(n): u'значение {}'.format(n) for n in range(size)}
+        text = generate_content(sorted(values))
+        snapshot = ShortcodeSnapshot(values)
+        assert snapshot.replace(text) == replace_in_loop(values, text)
+
+        number = max(1, 2000 // size)
+        loop = min(timeit.repeat(lambda: replace_in_loop(values, text),
+                                 number=number, repeat=repeat)) / number
+        single = min(timeit.repeat(lambda: snapshot.replace(text),
+                                   number=number, repeat=repeat)) / number
+        results.append((size, len(text), loop, single))
+    return results
+
+
+def main():
+    print('{:>10} {:>10} {:>12} {:>12} {:>8}'.format(
+        'shortcodes', 'chars', 'loop, ms', 'single, ms', 'speedup'))
+    for size, chars, loop, single in run():
+        print('{:>10} {:>10} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(
+            size, chars, loop * 1000, single * 1000, loop / single))
+
+
+if __name__ == '__main__':
+    main()
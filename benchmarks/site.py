@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Latency and SQL query counts of public and admin hot paths on a
+synthetic site built in a local PostgreSQL database.
+
+    python -m benchmarks.site --database postgresql:///jurist_bench [--size small ...]
+    python -m benchmarks.site compare OLD.json NEW.json
+
+The database given with --database is wiped with utils.init_db() and
+filled for every size, so never point it at real data. The response
+cache is cleared before every measured request except for the
+``cached`` cases, so the numbers are for rendering.
+Results are saved as JSON into benchmarks/results/.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+
+import flaskapp
+from flaskapp import app, db
+from synthetic_site import QueryCounter, build_site
+
+# (pages, questions) of the generated sites.
+SIZES = OrderedDict([
+    ('small', (1000, 10000)),
+    ('medium', (10000, 100000)),
+    ('large', (100000, 1000000)),
+])
+REQUESTS = 50
+WARMUP = 5
+PERCENTILES = (50, 90, 99)
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+# Relative change of p50 latency or mean query count reported as a regression.
+REGRESSION_THRESHOLD = 0.2
+
+
+def send(method, url, data):
+    return method(url, data=json.dumps(data), content_type='application/json')
+
+
+def load(response):
+    return json.loads(response.get_data(as_text=True))['Data']
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = max(0, int(round(p / 100.0 * len(ordered))) - 1)
+    return ordered[index]
+
+
+def measure(client, counter, request, requests, cached=False):
+    """
+    Time ``request(client, n)`` and count its queries.
+    """
+    latencies, queries = [], []
+    for n in range(-WARMUP, requests):
+        if not cached:
+            flaskapp.cache.clear()
+        counter.count = 0
+        started = time.perf_counter()
+        response = request(client, n)
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError('{} returned {}'.format(request.__name__, response.status_code))
+        if n >= 0:
+            latencies.append(elapsed * 1000)
+            queries.append(counter.count)
+    result = OrderedDict()
+    for p in PERCENTILES:
+        result['p{}_ms'.format(p)] = round(percentile(latencies, p), 3)
+    result['mean_ms'] = round(sum(latencies) / len(latencies), 3)
+    result['max_ms'] = round(max(latencies), 3)
+    result['queries_mean'] = round(sum(queries) / len(queries), 2)
+    result['queries_max'] = max(queries)
+    return result
+
+
+def get_cases(rows, questions):
+    """
+    ``(name, request, cached)`` for every measured case.
+    """
+    def urls(kind, count=100):
+        pages = [row for row in rows if row['kind'] == kind and row['has_visible_content']]
+        step = max(1, len(pages) // count)
+        return ['/{}/'.format(row['path']) for row in pages[::step]]
+
+    def get(name, choices):
+        def request(client, n):
+            return client.get(choices[n % len(choices)])
+        request.__name__ = name
+        return request
+
+    last_page = (questions - 1) // 10 + 1
+    service = rows[-1] if rows[-1]['kind'] == 'service' else rows[-2]
+    subcategory = next(row for row in rows if row['kind'] == 'subcategory')
+    question_ids = list(range(1, questions + 1, max(1, questions // 100)))
+
+    def question_payload(n):
+        return {
+            'heading': u'Новый вопрос {} {}'.format(n, time.time()),
+            'content_question': u'<p>Текст нового вопроса</p>',
+            'content_answer': u'<p>Ответ</p>', 'author': u'Автор',
+            'parent_id': subcategory['id'], 'jurist_id': 1,
+            'tags': [{'text': u'Тег 1'}, {'text': u'Новый тег {}'.format(n)}],
+        }
+
+    def page_payload(n):
+        return {
+            'label': 'new-service-{}-{}'.format(n, int(time.time() * 1000)),
+            'heading': u'Новая услуга', 'title': '', 'description': '',
+            'content': u'<p>Текст</p>', 'kind': 'service', 'priority': 0,
+            'visible_in_menu': True, 'parent_id': subcategory['id'],
+            'aux_field_1': '', 'aux_field_2': '', 'aux_field_3': '',
+            'tags': [{'text': u'Тег 2'}],
+        }
+
+    def page_post(client, n):
+        return send(client.post, '/admin/api/page', page_payload(n))
+
+    # Payloads of the edited rows, loaded by the first (warmup) request.
+    loaded = {}
+
+    def page_put(client, n):
+        if 'page' not in loaded:
+            loaded['page'] = load(client.get('/admin/api/page?id={}'.format(service['id'])))
+        data = dict(loaded['page'], heading=u'Услуга {}'.format(n))
+        return send(client.put, '/admin/api/page', data)
+
+    def question_post(client, n):
+        return send(client.post, '/admin/api/question', question_payload(n))
+
+    def question_put(client, n):
+        if 'question' not in loaded:
+            loaded['question'] = load(client.get('/admin/api/question?id={}'.format(
+                question_ids[-1])))
+        data = dict(loaded['question'], content_answer=u'<p>Новый ответ {}</p>'.format(n))
+        return send(client.put, '/admin/api/question', data)
+
+    return [
+        ('render_index', get('render_index', ['/']), False),
+        ('render_category (category)', get('category', urls('category')), False),
+        ('render_category (subcategory)', get('subcategory', urls('subcategory')), False),
+        ('render_category (service)', get('service', urls('service')), False),
+        ('render_category (paper)', get('paper', urls('paper')), False),
+        ('render_category (service, cached)', get('service', urls('service')[:WARMUP]), True),
+        ('render_question_answer (first pages)',
+         get('question_answer', ['/question-answer/?page={}'.format(n) for n in range(1, 6)]),
+         False),
+        ('render_question_answer (last pages)',
+         get('question_answer', ['/question-answer/?page={}'.format(n)
+                                 for n in range(max(1, last_page - 4), last_page + 1)]),
+         False),
+        ('render_single_question',
+         get('single_question', ['/question-answer/{}/'.format(id) for id in question_ids]),
+         False),
+        ('render_sitemap', get('sitemap', ['/sitemap.xml']), False),
+        ('render_sitemap_segment', get('sitemap_segment', ['/sitemap-1.xml']), False),
+        ('admin_category_list', get('admin_category_list', ['/admin/category/list']), False),
+        ('PageResource.post', page_post, True),
+        ('PageResource.put', page_put, True),
+        ('QuestionResource.post', question_post, True),
+        ('QuestionResource.put', question_put, True),
+    ]
+
+
+def run_size(name, pages, questions, requests):
+    started = time.perf_counter()
+    with app.app_context():
+        rows = build_site(pages, questions)
+    build = time.perf_counter() - started
+    print('{}: {} pages, {} questions built in {:.1f} s'.format(name, pages, questions, build))
+
+    # Caches built from the previous site are dropped with the versions.
+    for snapshot in (flaskapp.page_index, flaskapp.shortcode_cache, flaskapp.tag_index):
+        snapshot.invalidate()
+    counter = QueryCounter(db.engine)
+    results = OrderedDict()
+    with app.test_client() as client:
+        client.post('/admin/login', data={
+            'username': 'admin', 'password': app.config['DEFAULT_ADMIN_PASSWORD']})
+        for case, request, cached in get_cases(rows, questions):
+            results[case] = measure(client, counter, request, requests, cached=cached)
+            print('  {:<40} p50 {p50_ms:>9.2f} ms  p99 {p99_ms:>9.2f} ms  '
+                  'queries {queries_mean:>6.1f}'.format(case, **results[case]))
+    return OrderedDict([('pages', pages), ('questions', questions),
+                        ('build_s', round(build, 1)), ('cases', results)])
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], universal_newlines=True,
+            cwd=os.path.dirname(RESULTS_DIR), stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(database, sizes, requests=REQUESTS, output=None):
+    # Has to be set before the engine is created on first use.
+    app.config['SQLALCHEMY_DATABASE_URI'] = database
+
+    results = OrderedDict([
+        ('revision', git_revision()),
+        ('date', datetime.datetime.utcnow().isoformat()),
+        ('python', platform.python_version()),
+        ('requests', requests),
+        ('sizes', OrderedDict()),
+    ])
+    for name in sizes:
+        pages, questions = SIZES[name]
+        results['sizes'][name] = run_size(name, pages, questions, requests)
+
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, 'site-{}-{}.json'.format(
+            datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S'), results['revision']))
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print('Saved to {}'.format(output))
+    return results
+
+
+def compare(old_path, new_path, threshold=REGRESSION_THRESHOLD):
+    """
+    Print p50 latency and query count changes between two runs,
+    return the number of regressions.
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    regressions = 0
+    for size, result in new['sizes'].items():
+        if size not in old['sizes']:
+            continue
+        print(size)
+        for case, values in result['cases'].items():
+            before = old['sizes'][size]['cases'].get(case)
+            if before is None:
+                continue
+            flags = []
+            for key in ('p50_ms', 'queries_mean'):
+                if before[key] and (values[key] - before[key]) / before[key] > threshold:
+                    flags.append(key)
+            regressions += bool(flags)
+            print('  {:<40} p50 {:>9.2f} -> {:>9.2f} ms  queries {:>6.1f} -> {:>6.1f}  {}'.format(
+                case, before['p50_ms'], values['p50_ms'],
+                before['queries_mean'], values['queries_mean'],
+                'REGRESSION' if flags else ''))
+    return regressions
+
+
+def main():
+    if sys.argv[1:2] == ['compare']:
+        parser = argparse.ArgumentParser(prog='benchmarks.site compare')
+        parser.add_argument('old')
+        parser.add_argument('new')
+        args = parser.parse_args(sys.argv[2:])
+        sys.exit(1 if compare(args.old, args.new) else 0)
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', required=True,
+                        help='URL of a scratch PostgreSQL database, it is wiped')
+    parser.add_argument('--size', action='append', choices=list(SIZES),
+                        help='site sizes to build (default: small and medium)')
+    parser.add_argument('--requests', type=int, default=REQUESTS,
+                        help='measured requests per case')
+    parser.add_argument('--output', help='JSON file for the results')
+    args = parser.parse_args()
+    run(args.database, args.size or ['small', 'medium'], args.requests, args.output)
+
+
+if __name__ == '__main__':
+    main()
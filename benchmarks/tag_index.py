@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Build time and prefix completion latency of the in-memory tag index.
+
+    python -m benchmarks.tag_index
+"""
+
+import random
+import time
+
+from tag_index import TagIndex
+
+SIZES = (1000, 10000, 100000)
+LOOKUPS = 100000
+LIMIT = 10
+ALPHABET = u'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+
+
+def generate_names(size, seed=0):
+    rnd = random.Random(seed)
+    names = set()
+    while len(names) < size:
+        words = [''.join(rnd.choice(ALPHABET) for _ in range(rnd.randint(3, 10)))
+                 for _ in range(rnd.randint(1, 3))]
+        names.add(u' '.join(words).capitalize())
+    return list(names)
+
+
+def prefixes(names, count, seed=0):
+    rnd = random.Random(seed)
+    result = []
+    for _ in range(count):
+        name = rnd.choice(names)
+        result.append(name[:rnd.randint(1, 4)])
+    return result
+
+
+def run(sizes=SIZES, lookups=LOOKUPS, limit=LIMIT):
+    results = []
+    for size in sizes:
+        names = generate_names(size)
+
+        started = time.perf_counter()
+        index = TagIndex(names)
+        build = time.perf_counter() - started
+
+        queries = prefixes(names, lookups)
+        complete = index.complete
+        started = time.perf_counter()
+        for query in queries:
+            assert complete(query, limit)
+        lookup = (time.perf_counter() - started) / lookups
+        results.append((len(index), build, lookup))
+    return results
+
+
+def main():
+    print('{:>8} {:>10} {:>12}'.format('tags', 'build, ms', 'lookup, us'))
+    for size, build, lookup in run():
+        print('{:>8} {:>10.1f} {:>12.2f}'.format(size, build * 1000, lookup * 10 ** 6))
+
+
+if __name__ == '__main__':
+    main()
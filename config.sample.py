@@ -10,6 +10,10 @@ DEFAULT_ADMIN_PASSWORD = 'default-admin-password'
 DOMAIN_NAME = 'jurist-rus.ru'
 ROISTAT_KEY = 'roistat-key'
 ROISTAT_URL = 'http://example.com'
+CACHE_DIR = 'cache'
+# RESPONSE_CACHE = {'CACHE_TYPE': 'redis', 'CACHE_REDIS_PORT': 6379}
+# Log probable N+1 queries outside debug mode too.
+# QUERY_STATS = True
 
 DB_BACKUP_SMTP_HOST = 'smtp.yandex.ru'
 DB_BACKUP_SMTP_PORT = 465
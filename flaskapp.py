@@ -1,19 +1,19 @@
 # -*- coding: utf-8 -*-
 
 import json
+import os
 import logging
 import logging.handlers
 import functools
 from collections import namedtuple
 import datetime
 
-import dateutil.parser
 import arrow
 from jinja2 import TemplateNotFound
-import requests
 from werkzeug.routing import BaseConverter
 from flask import (Flask, request, redirect, url_for, render_template,
-                   abort, make_response, send_from_directory, session, g)
+                   abort, make_response, send_from_directory, session, g,
+                   Response, stream_with_context)
 from flask_sqlalchemy import SQLAlchemy, Pagination
 from flask_restful import Api, Resource
 from flask_login import (LoginManager, login_user,
@@ -23,8 +23,18 @@ import sqlalchemy.exc
 import sqlalchemy
 from flask_caching import Cache
 
+from versions import VersionStore, CachedSnapshot
+from shortcodes import ShortcodeSnapshot
+from page_index import PageIndex
+from tag_index import TagIndex
+from response_cache import ResponseCache
+from query_stats import QueryStats
+from validators import build_validator, conditional
+
 CACHE_SECONDS = int(datetime.timedelta(days=30).total_seconds())
 QUESTIONS_PER_PAGE = 10
+TAGS_AUTOCOMPLETE_LIMIT = 10
+TAGS_AUTOCOMPLETE_MAX_LIMIT = 50
 
 REDIRECTS = {
     ('msk', 'urist', 'semejnyj_jurist'):   ('family', None),
@@ -66,17 +76,6 @@ class LabelConverter(BaseConverter):
         # self.weight = 1
 
 
-class ShortcodesProxy(object):
-    @staticmethod
-    def get(code, default=None):
-        try:
-            return (db.session.query(models.Shortcode.value)
-                              .filter_by(key=code).scalar() or default)
-        except Exception as e:
-            app.logger.error('Error in ShortcodesProxy: {}'.format(e))
-        return default
-
-
 class CustomFlask(Flask):
     jinja_options = Flask.jinja_options.copy()
     jinja_options['trim_blocks'] = True
@@ -112,24 +111,115 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.session_protection = 'strong'
 
-# cache = RedisCache(port=6379, default_timeout=0, key_prefix=None)
-# cache = Cache(app, config={
-#     'CACHE_TYPE': 'redis',
-#     'CACHE_DEFAULT_TIMEOUT': 0,
-#     'CACHE_REDIS_PORT': 6379,
-# })
+CACHE_DIR = app.config.get('CACHE_DIR', 'cache')
+
+# Any flask_caching backend can be configured with RESPONSE_CACHE,
+# e.g. {'CACHE_TYPE': 'redis', 'CACHE_REDIS_PORT': 6379}.
+cache = Cache(app, config=app.config.get('RESPONSE_CACHE', {
+    'CACHE_TYPE': 'filesystem',
+    'CACHE_DIR': os.path.join(CACHE_DIR, 'responses'),
+    'CACHE_THRESHOLD': 5000,
+    'CACHE_DEFAULT_TIMEOUT': int(datetime.timedelta(days=1).total_seconds()),
+}))
+
+
+def load_shortcodes():
+    try:
+        rows = db.session.query(models.Shortcode.key, models.Shortcode.value).all()
+    except Exception:
+        db.session.rollback()
+        raise
+    return ShortcodeSnapshot(rows)
+
+
+def load_page_index():
+    Page = models.Page
+    try:
+        rows = db.session.query(Page.id, Page.label, Page.kind, Page.parent_id,
+                                Page.priority, Page.visible_in_menu,
+                                Page.date_modified, Page.heading, Page.path,
+                                Page.has_visible_content).all()
+    except Exception:
+        db.session.rollback()
+        raise
+    return PageIndex.from_rows(rows)
+
+
+def load_tag_index():
+    try:
+        rows = db.session.query(models.Tag.name).all()
+    except Exception:
+        db.session.rollback()
+        raise
+    return TagIndex(row.name for row in rows)
+
+
+def load_sitemap_segments():
+    try:
+        return sitemap.get_segments()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+versions = VersionStore(os.path.join(CACHE_DIR, 'versions'), logger=app.logger)
+shortcode_cache = CachedSnapshot(versions, 'shortcodes', load_shortcodes,
+                                 logger=app.logger, default=ShortcodeSnapshot())
+page_index = CachedSnapshot(versions, 'pages', load_page_index,
+                            logger=app.logger, default=PageIndex())
+tag_index = CachedSnapshot(versions, 'tags', load_tag_index,
+                           logger=app.logger, default=TagIndex())
+sitemap_segments = CachedSnapshot(versions, ['pages', 'questions'], load_sitemap_segments,
+                                  logger=app.logger, default=[])
+response_cache = ResponseCache(cache, versions, logger=app.logger)
+query_stats = QueryStats(app, logger=app.logger)
+
+
+def page_cache_tags(page_id):
+    """
+    Tags to bump when a page changes: the page itself and its parent,
+    whose menu lists it. Descendants are tagged with their ancestors.
+    """
+    tags = {'page:{}'.format(page_id)}
+    node = page_index.get().get_by_id(page_id)
+    if node is not None and node.parent_id is not None:
+        tags.add('page:{}'.format(node.parent_id))
+    return tags
+
+
+def get_breadcrumbs(page):
+    """
+    Breadcrumbs of a stored page built from the page index
+    instead of loading its ancestors.
+    """
+    if page.is_main():
+        return []
+    index = page_index.get()
+    node = index.get_by_id(page.id)
+    if node is None:
+        return page.generate_breadcrumbs()
+    crumbs = [models.Breadcrumb(p.heading, models.Page.url_for_path(p.kind, p.path))
+              for p in reversed(index.get_parents(node))]
+    return crumbs + [models.Breadcrumb(page.heading, None)]
+
+
+def invalidate_page(page_id, stale_tags=()):
+    page_index.invalidate()
+    response_cache.invalidate(*(page_cache_tags(page_id) | set(stale_tags)))
+
+
+def invalidate_tags(data):
+    """
+    Rebuild the autocomplete index if a save used tags it doesn't know.
+    """
+    names = [tag['text'] for tag in data.get('tags', [])]
+    if tag_index.get().has_unknown(names):
+        tag_index.invalidate()
 
 
 @app.template_filter('replace_shortcodes')
 def do_replace_shortcodes(value):
-    try:
-        shortcodes = db.session.query(models.Shortcode).all()
-    except Exception as e:
-        app.logger.error(e)
-        shortcodes = []
-    for shortcode in shortcodes:
-        value = value.replace('[{}]'.format(shortcode.key), shortcode.value)
-    return value
+    return shortcode_cache.get().replace(value)
 
 
 @login_manager.user_loader
@@ -141,9 +231,15 @@ def load_user_from_db(login):
     return None
 
 
+@app.before_first_request
+def warm_up_caches():
+    shortcode_cache.get()
+    page_index.get()
+
+
 @app.before_request
 def run_before_each_request():
-    g.shortcodes = ShortcodesProxy()
+    g.shortcodes = shortcode_cache.get()
     g.now = arrow.now()
 
 
@@ -166,7 +262,43 @@ def server_error_handler(e):
     return '<h1>500 Internal Server Error</h1>', 500
 
 
+def page_validator(category, subcategory=None, article=None, disallow_main=True):
+    parts = (category, subcategory, article)
+    if parts in TRIPLE_REDIRECTS:
+        return None
+    if parts == ('question-answer', None, None):
+        # Listed questions show headings of their categories.
+        tags = ['shortcodes', 'questions', 'pages']
+        node = page_index.get().get('question-answer')
+        date_modified = node.date_modified if node is not None else None
+        return build_validator(versions, request.full_path, tags, date_modified)
+    index = page_index.get()
+    node = index.resolve(*parts)
+    if node is None or node.is_main() and disallow_main or node.should_be_404():
+        return None
+    nodes = [node] + index.get_parents(node)
+    tags = ['shortcodes'] + ['page:{}'.format(n.id) for n in nodes]
+    return build_validator(versions, request.full_path, tags, node.date_modified)
+
+
+def question_validator(id):
+    Question = models.Question
+    row = (db.session.query(Question.parent_id, Question.date_modified)
+                     .filter_by(id=id).first())
+    if row is None:
+        return None
+    index = page_index.get()
+    tags = ['shortcodes', 'question:{}'.format(id), 'page:{}'.format(row.parent_id)]
+    for label in ['main', 'question-answer']:
+        node = index.get(label)
+        if node is not None:
+            tags.append('page:{}'.format(node.id))
+    return build_validator(versions, request.full_path, tags, row.date_modified)
+
+
 @app.route('/')
+@conditional(lambda: page_validator('main', disallow_main=False), max_age=CACHE_SECONDS)
+@response_cache.cached
 def render_index():
     return render_category(category='main', disallow_main=False)
 
@@ -197,85 +329,131 @@ def render_favicon():
     return send_from_directory(app.static_folder, 'favicon.ico')
 
 
+def build_sitemap_validator(path, segments):
+    """
+    Sitemap files change with their segments' id ranges, counts and dates,
+    and also when pages or questions are deleted or hidden, which only
+    shows in the versions named after the segments' kinds.
+    """
+    key = [path] + [(s.first_id, s.last_id, s.count, s.date_modified)
+                    for s in segments]
+    tags = sorted({s.kind for s in segments}) or ['pages', 'questions']
+    return build_validator(versions, repr(key), tags,
+                           sitemap.get_date_modified(segments))
+
+
+def sitemap_validator(number=None):
+    segments = sitemap_segments.get()
+    if number is not None:
+        segments = [s for s in segments if s.number == number]
+        if not segments:
+            return None
+    return build_sitemap_validator(request.path, segments)
+
+
 @app.route('/sitemap.xml')
+@conditional(sitemap_validator, max_age=CACHE_SECONDS)
 def render_sitemap():
-    Page = models.Page
-    Question = models.Question
-    pages = (db.session.query(Page)
-                       .order_by(Page.kind.desc(), Page.priority, Page.id).all())
-    questions = db.session.query(Question).order_by(Question.id).all()
-    response = make_response(render_template('company/sitemap.xml',
-                                             pages=pages,
-                                             questions=questions))
+    segments = sitemap_segments.get()
+    if sum(s.count for s in segments) <= sitemap.MAX_URLS:
+        return _generate_sitemap_response('company/sitemap.xml', segments,
+                                          urls=sitemap.generate_urls(segments))
+    items = []
+    for s in segments:
+        path = url_for('render_sitemap_segment', number=s.number)
+        # The same date the segment's own Last-Modified has.
+        modified = build_sitemap_validator(path, [s]).last_modified
+        items.append((url_for('render_sitemap_segment', number=s.number, _external=True),
+                      modified.format(sitemap.LASTMOD_FORMAT)))
+    return _generate_sitemap_response('company/sitemap-index.xml', segments,
+                                      sitemaps=items)
+
+
+@app.route('/sitemap-<int:number>.xml')
+@conditional(sitemap_validator, max_age=CACHE_SECONDS)
+def render_sitemap_segment(number):
+    segments = [s for s in sitemap_segments.get() if s.number == number]
+    if not segments:
+        abort(404)
+    return _generate_sitemap_response('company/sitemap.xml', segments,
+                                      urls=sitemap.generate_urls(segments))
+
+
+def _generate_sitemap_response(template, segments, **kwargs):
+    stream = app.jinja_env.get_template(template).generate(**kwargs)
+    response = Response(stream_with_context(sitemap.buffered(stream)))
+    # Keeps make_conditional() from consuming the stream to count its length.
+    response.implicit_sequence_conversion = False
     response.headers['Content-Type'] = 'text/xml; charset=utf-8'
     response.headers['X-Robots-Tag'] = 'noindex'
     response.headers['Cache-Control'] = 'max-age={}'.format(CACHE_SECONDS)
-    return response
+    validator = g.get('validator')
+    if validator is not None:
+        response.set_etag(validator.etag)
+        modified = validator.last_modified
+    else:
+        modified = sitemap.get_date_modified(segments)
+    if modified is not None:
+        response.headers['Last-Modified'] = utils.to_http_timestamp(modified)
+    return response.make_conditional(request)
 
 
-def generate_navigation_menu(page):
-    Page = models.Page
+MENU_KINDS = ['category', 'subcategory', 'service']
 
-    def get_item(p):
-        if p.label == page.label or p.should_be_404():
+# The page index and the menus built from it by parent page id. All of
+# them are dropped at once when a new index (after any page change) shows up.
+_menus = (None, {})
+
+
+def build_menu(index, parent_id):
+    """
+    Labels and menu items of the children of a page shown in its menu.
+    """
+    Page = models.Page
+    children = [node for node in index.get_children(parent_id)
+                if node.visible_in_menu and node.kind in MENU_KINDS]
+    children.sort(key=lambda node: MENU_KINDS.index(node.kind))
+    items = []
+    for node in children:
+        if node.should_be_404():
             url = None
         else:
-            url = p.get_url()
-        important = p.kind in ['category', 'subcategory']
-        return MenuItem(name=p.heading, url=url, important=important)
+            url = Page.url_for_path(node.kind, node.path)
+        important = node.kind in ['category', 'subcategory']
+        items.append((node.label, MenuItem(name=node.heading, url=url, important=important)))
+    return items
+
 
-    shown = ['category', 'subcategory', 'service']
-    if not (page.is_main() or page.kind in shown):
+def get_menu(parent_id):
+    global _menus
+    index = page_index.get()
+    menus_index, menus = _menus
+    if menus_index is not index:
+        menus = {}
+        _menus = (index, menus)
+    items = menus.get(parent_id)
+    if items is None:
+        items = menus[parent_id] = build_menu(index, parent_id)
+    return items
+
+
+def generate_navigation_menu(page):
+    if not (page.is_main() or page.kind in MENU_KINDS):
         return []
     if page.kind == 'service':
         parent_id = page.parent_id
     else:
         parent_id = page.id
-    cases = sqlalchemy.case([(Page.kind == k, n) for n, k in enumerate(shown)])
-    pages = (
-        db.session.query(Page)
-                  .filter_by(parent_id=parent_id)
-                  .filter_by(visible_in_menu=True)
-                  .filter(Page.kind.in_(shown))
-                  .order_by(cases, Page.priority, Page.id).all()
-    )
-    return [get_item(p) for p in pages]
+    # The current page is listed without a link.
+    return [item._replace(url=None) if label == page.label else item
+            for label, item in get_menu(parent_id)]
 
 
 def get_page_cascade(*parts):
-
-    def get_page(label):
-        if label is None:
-            return None
-        return models.Page.get_by_label(label)
-
-    def check(parts, masks):
-        return all((a is not None) is bool(b) for a, b in zip(parts, masks))
-
-    try:
-        pages = tuple(get_page(label) for label in parts)
-    except NoResultFound:
+    node = page_index.get().resolve(*parts)
+    if node is None:
         return None
-
-    try:
-        if check(parts, (1, 0, 0)):
-            assert pages[0].kind in ['main', 'static', 'category']
-            return pages[0]
-
-        if check(parts, (1, 1, 0)):
-            assert pages[0].kind == 'category'
-            assert pages[0].is_parent_of(pages[1])
-            return pages[1]
-
-        if check(parts, (1, 1, 1)):
-            assert pages[0].kind == 'category'
-            assert pages[1].kind == 'subcategory'
-            assert pages[0].is_parent_of(pages[1])
-            assert pages[1].is_parent_of(pages[2])
-            return pages[2]
-    except AssertionError:
-        pass
-    return None
+    return db.session.query(models.Page).get(node.id)
 
 
 def render_question_answer():
@@ -288,96 +466,107 @@ def render_question_answer():
     if number < 1:
         abort(404)
 
+    response_cache.tag('shortcodes', 'questions')
     try:
         page = models.Page.get_by_label('question-answer')
     except NoResultFound:
         abort(404)
+    response_cache.tag(*['page:{}'.format(id)
+                         for id in [page.id] + list(page.ancestor_ids)])
 
-    total = db.session.query(Question.id).count()
-    questions = (
-        db.session.query(Question)
-                  .order_by(Question.id.desc())
-                  .limit(QUESTIONS_PER_PAGE)
-                  .offset(QUESTIONS_PER_PAGE * (number - 1)).all()
-    )
+    stats = models.QuestionStats.get()
+    questions = Question.get_listing_page(number, stats.total, QUESTIONS_PER_PAGE)
     if not questions and number != 1:
         abort(404)
-    pagination = Pagination(None, number, QUESTIONS_PER_PAGE, total, items=questions)
-    modified = (
-        db.session.query(Question.date_modified)
-                  .order_by(Question.date_modified.desc()).limit(1).scalar()
-    )
+    pagination = Pagination(None, number, QUESTIONS_PER_PAGE, stats.total, items=questions)
+    modified = stats.date_modified
     if modified and modified > page.date_modified:
         page.date_modified = modified
+    page.breadcrumbs = get_breadcrumbs(page)
+    response_cache.tag(*['page:{}'.format(q.parent_id) for q in questions])
     return _generate_response('company/question-answer.html', page=page,
                               pagination=pagination)
 
 
 @app.route('/question-answer/<int:id>/')
+@conditional(question_validator, max_age=CACHE_SECONDS)
+@response_cache.cached
 def render_single_question(id):
+    response_cache.tag('shortcodes', 'question:{}'.format(id))
     question = db.session.query(models.Question).get(id)
     if question is None:
         abort(404)
+    index = page_index.get()
+    parents = []
+    for label in ['main', 'question-answer']:
+        node = index.get(label)
+        if node is None:
+            parents = None
+            break
+        response_cache.tag('page:{}'.format(node.id))
+        parents.append(models.Breadcrumb(
+            node.heading, models.Page.url_for_path(node.kind, node.path)))
+    response_cache.tag('page:{}'.format(question.parent_id))
     return _generate_response('company/single-question.html',
-                              page=question.generate_page(),
+                              page=question.generate_page(parents),
                               question=question)
 
 
 def _generate_response(template, **kwargs):
-    try:
-        stamp = request.headers['If-Modified-Since']
-        if_modified_since = arrow.get(dateutil.parser.parse(stamp))
-        last_modified = kwargs['page'].date_modified
-        if last_modified and last_modified < if_modified_since:
-            return make_response('', 304)
-    except KeyError:
-        pass
-    except Exception:
-        app.logger.exception('Could not handle If-Modified-Since.')
-        pass
-
     try:
         response = make_response(render_template(template, **kwargs))
     except TemplateNotFound:
         app.logger.exception('Template not found.')
         abort(404)
-    try:
-        response.headers['Last-Modified'] = \
-            utils.to_http_timestamp(kwargs['page'].date_modified)
-    except (KeyError, AttributeError):
-        # AttributeError is raised if page.date_modified is None
-        pass
+
+    validator = g.get('validator')
+    if validator is not None:
+        response.set_etag(validator.etag)
+        last_modified = validator.last_modified
+    else:
+        response.add_etag()
+        last_modified = getattr(kwargs.get('page'), 'date_modified', None)
+    if last_modified is not None:
+        response.headers['Last-Modified'] = utils.to_http_timestamp(last_modified)
     response.headers['Cache-Control'] = 'max-age={}'.format(CACHE_SECONDS)
-    return response
+    return response.make_conditional(request)
 
 
 @app.route('/<label:category>/')
 @app.route('/<label:category>/<label:subcategory>/')
 @app.route('/<label:category>/<label:subcategory>/<label:article>/')
+@conditional(page_validator, max_age=CACHE_SECONDS)
+@response_cache.cached
 def render_category(category, subcategory=None, article=None, disallow_main=True):
     parts = (category, subcategory, article)
 
     def _redirect(*triple):
         packed = dict(zip(['category', 'subcategory', 'article'], triple))
-        return redirect(('render_category', **packed), code=301)
+        return redirect(url_for('render_category', **packed), code=301)
 
     if parts in TRIPLE_REDIRECTS:
         return _redirect(*TRIPLE_REDIRECTS[parts])
     if parts == ('question-answer', None, None):
         return render_question_answer()
 
+    response_cache.tag('shortcodes')
     page = get_page_cascade(*parts)
+    if page is not None:
+        response_cache.tag(*['page:{}'.format(id)
+                             for id in [page.id] + list(page.ancestor_ids)])
     if (page is None or
             page.is_main() and disallow_main or
             page.should_be_404()):
         abort(404)
     menu = generate_navigation_menu(page)
+    page.breadcrumbs = get_breadcrumbs(page)
     template = TEMPLATES_MAPPING.get(page.label, 'company/page.html')
     return _generate_response(template, page=page, menu=menu)
 
 
 @app.route('/sender', methods=['POST'])
 def send_lead_to_crm():
+    payloads = {}
     try:
         lead = {}
         f = request.form
@@ -398,17 +587,24 @@ def send_lead_to_crm():
         if f.get('question'):
             lead['question'] = u'{} Комментарий: {}'.format(lead['question'],
                                                             f.get('question'))
-        requests.post(app.config['CRM_URL'], json=lead)
-        app.logger.info('LEAD SENT TO CRM: {}'.format(dict_to_json(lead)))
+        payloads['crm'] = lead
     except Exception:
         app.logger.exception('Lead not processed in /sender')
 
     try:
         lead_ = leads_distributor.Lead(request.form)
         if not lead_.is_spam():
-            leads_distributor.send_to_roistat(lead_)
+            payloads['roistat'] = leads_distributor.format_roistat_params(lead_)
+    except Exception:
+        app.logger.exception('Lead not prepared for Roistat')
+
+    # Delivery is done by lead_worker.py, so a slow CRM
+    # cannot tie up the web server threads.
+    try:
+        models.OutboxLead.enqueue(payloads)
     except Exception:
-        app.logger.exception('Lead not sent to Roistat')
+        app.logger.exception('Lead not saved to outbox: {}'.format(
+            utils.dict_to_json(payloads)))
 
     return redirect(url_for('thanks'))
 
@@ -558,7 +754,7 @@ def admin_category_edit(id):
 @app.route('/admin/category/list')
 @login_required
 def admin_category_list():
-    categories = models.Category.get_all()
+    categories = models.Category.get_all_with_stats()
     rendered = render_template('admin/admin_list_category.html', categories=categories)
     return rendered
 
@@ -649,14 +845,17 @@ def intercept_exceptions(f):
 class TagsAutocomplete(Resource):
     def get(self):
         try:
-            query = request.args.get('query')
-            if query is None:
+            query = request.args.get('query', '').strip()
+            if not query:
                 return []
-            template = u'%{}%'.format(query.strip())
-            Tag = models.Tag
-            tags = (db.session.query(Tag).filter(Tag.name.ilike(template))
-                              .order_by(Tag.name).all())
-            return [{'text': tag.name} for tag in tags]
+            limit = request.args.get('limit', TAGS_AUTOCOMPLETE_LIMIT, type=int)
+            limit = max(1, min(limit, TAGS_AUTOCOMPLETE_MAX_LIMIT))
+            # Prefix matches come first, from memory; the rest of the list
+            # is filled with substring matches from the trigram index.
+            names = tag_index.get().complete(query, limit)
+            if len(names) < limit:
+                names += models.Tag.find_containing(query, limit - len(names))
+            return [{'text': name} for name in names]
         except Exception:
             app.logger.exception('Cannot fetch tags.')
             return []
@@ -695,21 +894,26 @@ class PageResource(Resource):
     @login_required
     @intercept_exceptions
     def post(self):
-        models.Page.api_create(request.json)
-        # cache.clear()
+        id = models.Page.api_create(request.json)
+        invalidate_page(id)
+        invalidate_tags(request.json)
 
     @login_required
     @intercept_exceptions
     def put(self):
+        id = int(request.json['id'])
+        stale_tags = page_cache_tags(id)
         models.Page.api_update(request.json)
-        # cache.clear()
+        invalidate_page(id, stale_tags)
+        invalidate_tags(request.json)
 
     @login_required
     @intercept_exceptions
     def delete(self):
         id = int(request.args['id'])
+        stale_tags = page_cache_tags(id)
         models.Page.api_delete(id)
-        # cache.clear()
+        invalidate_page(id, stale_tags | {'questions'})
 
 
 class QuestionResource(Resource):
@@ -723,20 +927,22 @@ class QuestionResource(Resource):
     @intercept_exceptions
     def post(self):
         models.Question.api_create(request.json)
-        # cache.clear()
+        response_cache.invalidate('questions')
+        invalidate_tags(request.json)
 
     @login_required
     @intercept_exceptions
     def put(self):
-        models.Question.api_update(request.json)
-        # cache.clear()
+        id = models.Question.api_update(request.json)
+        response_cache.invalidate('questions', 'question:{}'.format(id))
+        invalidate_tags(request.json)
 
     @login_required
     @intercept_exceptions
     def delete(self):
         id = int(request.args['id'])
         models.Question.api_delete(id)
-        # cache.clear()
+        response_cache.invalidate('questions', 'question:{}'.format(id))
 
 
 class ShortcodeResource(Resource):
@@ -750,20 +956,20 @@ class ShortcodeResource(Resource):
     @intercept_exceptions
     def post(self):
         models.Shortcode.api_create(request.json)
-        # cache.clear()
+        shortcode_cache.invalidate()
 
     @login_required
     @intercept_exceptions
     def put(self):
         models.Shortcode.api_update(request.json)
-        # cache.clear()
+        shortcode_cache.invalidate()
 
     @login_required
     @intercept_exceptions
     def delete(self):
         id = int(request.args['id'])
         models.Shortcode.api_delete(id)
-        # cache.clear()
+        shortcode_cache.invalidate()
 
 
 class LabelPicker(Resource):
@@ -805,6 +1011,7 @@ api.add_resource(ShortcodeResource, '/admin/api/shortcode')
 import models
 import utils
 import leads_distributor
+import sitemap
 
 
 if __name__ == '__main__':
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Delivers leads saved by /sender to CRM and Roistat.
+
+Runs next to the web application (see crontab):
+
+    python3 lead_worker.py [--threads 4] [--once]
+
+CRM_URL and ROISTAT_URL may point to a local HTTP stub for testing.
+"""
+
+import argparse
+import signal
+import threading
+
+import requests
+
+import flaskapp
+import models
+import leads_distributor
+import utils
+
+app = flaskapp.app
+db = flaskapp.db
+
+THREADS = 4
+POLL_SECONDS = 2
+MAX_ATTEMPTS = 12
+RETRY_SECONDS = 30
+MAX_RETRY_SECONDS = 6 * 60 * 60
+
+
+def deliver_next(http):
+    """
+    Deliver one due lead. Returns False if nothing was due.
+    """
+    try:
+        delivery = models.LeadDelivery.claim()
+        if delivery is None:
+            db.session.commit()
+            return False
+        try:
+            leads_distributor.deliver(delivery.target, delivery.payload, session=http)
+        except Exception as e:
+            delivery.mark_failed(e, MAX_ATTEMPTS, RETRY_SECONDS, MAX_RETRY_SECONDS)
+            app.logger.warning('Lead {} not sent to {} (attempt {}): {}'.format(
+                delivery.lead_id, delivery.target, delivery.attempts, e))
+        else:
+            delivery.mark_sent()
+            app.logger.info('LEAD SENT TO {}: {}'.format(
+                delivery.target.upper(), utils.dict_to_json(delivery.payload)))
+        db.session.commit()
+        return True
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def run_worker(stop, once=False):
+    # One pooled HTTP session per thread, reused for all deliveries.
+    http = requests.Session()
+    with app.app_context():
+        try:
+            while not stop.is_set():
+                try:
+                    delivered = deliver_next(http)
+                except Exception:
+                    app.logger.exception('Error in lead worker.')
+                    delivered = False
+                if not delivered:
+                    if once:
+                        break
+                    stop.wait(POLL_SECONDS)
+        finally:
+            http.close()
+            db.session.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=THREADS)
+    parser.add_argument('--once', action='store_true',
+                        help='exit when there is nothing left to deliver')
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    threads = [threading.Thread(target=run_worker, args=(stop, args.once))
+               for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=1)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+if __name__ == '__main__':
+    main()
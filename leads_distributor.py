@@ -10,6 +10,8 @@ from phonenumbers import format_number, PhoneNumberFormat, NumberParseException
 import flaskapp
 
 COUNTRY = 'RU'
+# (connect, read) timeouts for CRM and Roistat requests, seconds.
+TIMEOUT = (3.05, 15)
 
 
 class Lead(object):
@@ -86,13 +88,29 @@ def _flatten(data, name):
     return fixed
 
 
-def send_to_roistat(lead):
-    data = _flatten(lead.format_for_roistat(), 'fields')
-    # r = requests.Request('GET', flaskapp.app.config['ROISTAT_URL'], params=data)
-    # prepared = r.prepare()
-    # requests.Session().send(prepared)
-    requests.get(flaskapp.app.config['ROISTAT_URL'], params=data)
+def format_roistat_params(lead):
+    return _flatten(lead.format_for_roistat(), 'fields')
 
 
-def send_to_leadok(lead):
-    requests.post(flaskapp.app.config['CRM_URL'], json=lead.format_for_leadok())
+def send_to_roistat(lead, session=requests):
+    deliver('roistat', format_roistat_params(lead), session=session)
+
+
+def send_to_leadok(lead, session=requests):
+    deliver('crm', lead.format_for_leadok(), session=session)
+
+
+def deliver(target, payload, session=requests):
+    """
+    Send a prepared payload to the target ('crm' or 'roistat').
+    Raises on network errors, timeouts and non-2xx responses.
+    """
+    config = flaskapp.app.config
+    if target == 'crm':
+        response = session.post(config['CRM_URL'], json=payload, timeout=TIMEOUT)
+    elif target == 'roistat':
+        response = session.get(config['ROISTAT_URL'], params=payload, timeout=TIMEOUT)
+    else:
+        raise ValueError('Unknown lead target: {}'.format(target))
+    response.raise_for_status()
+    return response
@@ -10,7 +10,6 @@ import random
 import arrow
 from bs4 import BeautifulSoup
 import transliterate
-import jinja2.filters
 import sqlalchemy
 from sqlalchemy import (
     Table, Column as BaseColumn, CheckConstraint,
@@ -18,10 +17,12 @@ from sqlalchemy import (
     Boolean, String, UnicodeText, Integer, PrimaryKeyConstraint,
 )
 from sqlalchemy.orm import relationship
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy_utils import ArrowType
 import flask
 
-from flaskapp import db, app
+from flaskapp import db, app, QUESTIONS_PER_PAGE
 import utils
 
 
@@ -32,9 +33,14 @@ LONG_DASH_PREFIX = u'— '
 SALT = 'salt_sef3r3++---03'
 HTML_PARSER = 'html.parser'
 LANG = 'ru'
+AUX_FIELDS = ['aux_field_1', 'aux_field_2', 'aux_field_3']
+# Elements that are visible content without any text.
+MEDIA_TAGS = ['img', 'iframe', 'embed', 'object', 'video', 'audio', 'svg', 'canvas']
 
-Action = Enum('Action', 'CREATE, MODIFY')
+Action = Enum('Action', 'CREATE, MODIFY, DELETE')
 Breadcrumb = namedtuple('Breadcrumb', 'name, url')
+CategoryStats = namedtuple('CategoryStats', 'services, papers, questions, '
+                           'subtree_services, subtree_papers, subtree_questions')
 Column = functools.partial(BaseColumn, nullable=False)
 CascadeForeignKey = functools.partial(ForeignKey, ondelete='CASCADE')
 
@@ -46,6 +52,8 @@ class ApiMixin(object):
             obj = db.session.query(cls).get(id)
             assert obj is not None
             db.session.delete(obj)
+            db.session.flush()
+            cls._api_after_write(Action.DELETE, id)
             if commit:
                 db.session.commit()
         except Exception:
@@ -54,11 +62,11 @@ class ApiMixin(object):
 
     @classmethod
     def api_create(cls, data, commit=True):
-        cls.api_alter(data, action=Action.CREATE, commit=commit)
+        return cls.api_alter(data, action=Action.CREATE, commit=commit)
 
     @classmethod
     def api_update(cls, data, commit=True):
-        cls.api_alter(data, action=Action.MODIFY, commit=commit)
+        return cls.api_alter(data, action=Action.MODIFY, commit=commit)
 
     @classmethod
     def api_alter(cls, data, action=Action.CREATE, commit=True):
@@ -73,11 +81,19 @@ class ApiMixin(object):
 
             if action is Action.CREATE:
                 db.session.add(obj)
+            db.session.flush()
+            id = obj.id
+            cls._api_after_write(action, id)
             if commit:
                 db.session.commit()
         except Exception:
             db.session.rollback()
             raise
+        return id
+
+    @classmethod
+    def _api_after_write(cls, action, id):
+        pass
 
     @staticmethod
     def api_fix_data(data):
@@ -117,6 +133,13 @@ class TagsGetterMixin(object):
         arr.sort(key=lambda x: x['text'])
         return arr
 
+    def set_tags(self, tags):
+        # Tag links have no timestamp of their own: snapshots pick them
+        # up by date_modified of the page or question they belong to.
+        if set(tags) != set(self.tags):
+            self.tags = tags
+            self.date_modified = arrow.utcnow()
+
 
 class CreatedModifiedMixin(object):
     date_created  = Column(ArrowType(timezone=True), default=arrow.utcnow)
@@ -165,28 +188,61 @@ class Tag(db.Model):
         Index("index_unique_lowercase_tag_name",
               sqlalchemy.text("lower(name)"),
               unique=True),
+        # Needs the pg_trgm extension, serves ILIKE '%...%' searches.
+        Index("index_tags_name_trigram", "name",
+              postgresql_using="gin",
+              postgresql_ops={"name": "gin_trgm_ops"}),
     )
 
     def __init__(self, name):
         self.name = name
 
-    @classmethod
-    def add_by_names(cls, names):
+    @staticmethod
+    def normalize_names(names):
+        seen = set()
+        normalized = []
         for name in names:
-            query = db.session.query(cls.id).filter(cls.name.ilike(name))
-            if not query.count():
-                db.session.add(cls(name=name))
+            name = name.strip()
+            if name and name.lower() not in seen:
+                seen.add(name.lower())
+                normalized.append(name)
+        return normalized
 
     @classmethod
-    def get_by_names(cls, names):
+    def resolve(cls, names):
+        names = cls.normalize_names(names)
         if not names:
             return []
-        conds = [cls.name.ilike(name) for name in names]
-        return (
+        insert = (
+            postgresql.insert(cls.__table__)
+                      .values([{'name': name} for name in names])
+                      .on_conflict_do_nothing(
+                          index_elements=[sqlalchemy.text('lower(name)')])
+        )
+        db.session.execute(insert)
+        # Names are lower-cased by the database, as in the unique index.
+        lowered = sqlalchemy.select([sqlalchemy.func.lower(sqlalchemy.func.unnest(
+            sqlalchemy.bindparam('names', names, type_=ARRAY(UnicodeText))))])
+        tags = (
             db.session.query(cls)
-                      .filter(sqlalchemy.or_(*conds))
+                      .filter(sqlalchemy.func.lower(cls.name).in_(lowered))
                       .order_by(cls.name).all()
         )
+        assert len(tags) == len(names)
+        return tags
+
+    @classmethod
+    def find_containing(cls, query, limit):
+        escaped = (query.replace('\\', '\\\\')
+                        .replace('%', '\\%')
+                        .replace('_', '\\_'))
+        rows = (
+            db.session.query(cls.name)
+                      .filter(cls.name.ilike(u'%{}%'.format(escaped), escape='\\'))
+                      .filter(~cls.name.ilike(u'{}%'.format(escaped), escape='\\'))
+                      .order_by(cls.name).limit(limit).all()
+        )
+        return [row.name for row in rows]
 
     def __repr__(self):
         return u"Tag('{}')".format(self.name)
@@ -211,6 +267,17 @@ class Page(CreatedModifiedMixin, TagsGetterMixin, ApiMixin, db.Model):
     aux_field_1     = Column(UnicodeText, default='')
     aux_field_2     = Column(UnicodeText, default='')
     aux_field_3     = Column(UnicodeText, default='')
+    # Materialized position in the tree: labels from the root (main page
+    # excluded) joined with '/' and ancestor ids ordered from the root.
+    path            = Column(String, default='')
+    ancestor_ids    = Column(ARRAY(Integer), default=list)
+    # Aux fields as rendered: the page's own value or the nearest
+    # ancestor's non-empty one.
+    resolved_aux_field_1 = Column(UnicodeText, default='')
+    resolved_aux_field_2 = Column(UnicodeText, default='')
+    resolved_aux_field_3 = Column(UnicodeText, default='')
+    # Content has visible text once HTML tags are stripped, set on save.
+    has_visible_content = Column(Boolean, default=False)
 
     tags = relationship('Tag', secondary=pages_and_tags_table, order_by='Tag.name')
     parent = relationship('Page', foreign_keys='[Page.parent_id]', remote_side=[id])
@@ -237,53 +304,65 @@ class Page(CreatedModifiedMixin, TagsGetterMixin, ApiMixin, db.Model):
                                 AND parent_kind IS NOT NULL)
             """
         ),
+        Index('index_pages_ancestor_ids', 'ancestor_ids', postgresql_using='gin'),
+        # Pages that are served, i.e. listed in the sitemap.
+        Index('index_pages_public', 'id',
+              postgresql_where=sqlalchemy.or_(kind != 'service', has_visible_content)),
     )
 
+    TREE_FIELDS = ['path', 'ancestor_ids'] + ['resolved_' + key for key in AUX_FIELDS]
+
     def is_parent_of(self, other):
         return self.id == other.parent_id
 
     def get_parents(self):
-        parents = ()
-        parent = self.parent
-        while parent is not None:
-            parents += (parent,)
-            parent = parent.parent
-        return parents
+        ids = self.ancestor_ids or []
+        if not ids:
+            return ()
+        pages = db.session.query(Page).filter(Page.id.in_(ids)).all()
+        by_id = {p.id: p for p in pages}
+        return tuple(by_id[id] for id in reversed(ids))
 
     def get_chain(self):
         return (self,) + self.get_parents()
 
     def get_url(self, _external=False):
+        return self.url_for_path(self.kind, self.path, _external=_external)
+
+    @staticmethod
+    def url_for_path(kind, path, _external=False):
         _url_for = functools.partial(flask.url_for, _external=_external)
 
-        if self.is_main():
+        if kind == 'main':
             return _url_for('render_index')
 
         words = ['category', 'subcategory', 'article']
-        parts = [p.label for p in self.get_chain()[:-1][::-1]]
+        parts = path.split('/')
         return _url_for('render_category', **dict(zip(words, parts)))
 
     def should_be_404(self):
-        return self.kind in ['service'] and self.is_content_empty()
+        return self.kind in ['service'] and not self.has_visible_content
+
+    # SQL counterpart of ``not page.should_be_404()``.
+    @classmethod
+    def sitemap_condition(cls):
+        return sqlalchemy.or_(cls.kind != 'service', cls.has_visible_content)
 
     def is_main(self):
         return self.kind == 'main'
 
     def is_content_empty(self, strip_tags=False):
+        return self.is_html_empty(self.content, strip_tags=strip_tags)
+
+    @staticmethod
+    def is_html_empty(html, strip_tags=False):
         if strip_tags:
-            soup = BeautifulSoup(self.content, 'html5lib')
-            return not soup.get_text().strip()
-        return not self.content.strip()
+            soup = BeautifulSoup(html, 'html5lib')
+            return not soup.get_text().strip() and soup.find(MEDIA_TAGS) is None
+        return not html.strip()
 
     def generate_aux_fields(self):
-        keys = ['aux_field_1', 'aux_field_2', 'aux_field_3']
-        fields = {key: '' for key in keys}
-        for key in fields:
-            parent = self
-            while not fields[key] and parent is not None:
-                fields[key] = getattr(parent, key)
-                parent = parent.parent
-        return fields
+        return {key: getattr(self, 'resolved_' + key) or '' for key in AUX_FIELDS}
 
     def generate_breadcrumbs(self):
         if getattr(self, 'breadcrumbs', None) is not None:
@@ -329,37 +408,39 @@ class Page(CreatedModifiedMixin, TagsGetterMixin, ApiMixin, db.Model):
     def get_sorted_pages(cls, kind):
         assert kind in ['paper', 'service']
 
-        def key(page):
-            par1 = page.parent
-            par2 = page.parent.parent
-            if par2.kind == 'category':
-                return (par2.priority, par2.id,
-                        par1.priority, par1.id,
-                        page.priority, page.id)
-            return (par1.priority, par1.id,
-                    0, 0,
-                    page.priority, page.id)
-
-        pages = db.session.query(cls).filter_by(kind=kind).all()
-        pages.sort(key=key)
-        return pages
+        parent = sqlalchemy.orm.aliased(cls)
+        grandparent = sqlalchemy.orm.aliased(cls)
+
+        def nested(then, else_):
+            return sqlalchemy.case([(grandparent.kind == 'category', then)], else_=else_)
+
+        return (
+            db.session.query(cls)
+                      .join(parent, cls.parent)
+                      .join(grandparent, parent.parent)
+                      .options(sqlalchemy.orm.contains_eager(cls.parent.of_type(parent))
+                                             .contains_eager(parent.parent.of_type(grandparent)))
+                      .filter(cls.kind == kind)
+                      .order_by(nested(grandparent.priority, parent.priority),
+                                nested(grandparent.id, parent.id),
+                                nested(parent.priority, 0),
+                                nested(parent.id, 0),
+                                cls.priority, cls.id).all()
+        )
 
     @classmethod
     def _api_alter(cls, obj, data):
         page = obj
 
-        Tag.add_by_names(data['tags'])
-        page.tags = Tag.get_by_names(data['tags'])
-
-        assert len(page.tags) == len(data['tags'])
+        page.set_tags(Tag.resolve(data['tags']))
 
         keys = [
             'heading', 'label', 'title', 'content', 'kind',
             'visible_in_menu', 'description', 'priority',
-            'aux_field_1', 'aux_field_2', 'aux_field_3',
-        ]
+        ] + AUX_FIELDS
         for key in keys:
             setattr(page, key, data[key])
+        page.has_visible_content = not page.is_content_empty(strip_tags=True)
 
         with db.session.no_autoflush:
             if page.kind == 'main':
@@ -372,6 +453,61 @@ class Page(CreatedModifiedMixin, TagsGetterMixin, ApiMixin, db.Model):
             page.parent_id = parent.id
             page.parent_kind = parent.kind
 
+        parent_node = None if parent.id is None else parent.tree_node()
+        fields = cls._tree_fields(page.label, [getattr(page, key) for key in AUX_FIELDS],
+                                  parent_node)
+        changed = any(getattr(page, key) != value for key, value in fields.items())
+        for key, value in fields.items():
+            setattr(page, key, value)
+        if page.id is not None and changed:
+            cls._cascade_tree_fields(page)
+
+    def tree_node(self):
+        node = {key: getattr(self, key) for key in self.TREE_FIELDS}
+        node['id'] = self.id
+        return node
+
+    @staticmethod
+    def _tree_fields(label, aux_fields, parent):
+        if parent is None:
+            fields = {'path': '', 'ancestor_ids': []}
+        else:
+            fields = {
+                'path': '/'.join(p for p in (parent['path'], label) if p),
+                'ancestor_ids': list(parent['ancestor_ids'] or []) + [parent['id']],
+            }
+        for key, value in zip(AUX_FIELDS, aux_fields):
+            inherited = '' if parent is None else parent['resolved_' + key]
+            fields['resolved_' + key] = value or inherited or ''
+        return fields
+
+    @classmethod
+    def _cascade_tree_fields(cls, page):
+        aux_columns = [getattr(cls, key) for key in AUX_FIELDS]
+        rows = (
+            db.session.query(cls.id, cls.label, cls.parent_id, *aux_columns)
+                      .filter(cls.ancestor_ids.any(page.id)).all()
+        )
+        children = {}
+        for row in rows:
+            children.setdefault(row.parent_id, []).append(row)
+
+        mappings = []
+        queue = [page.tree_node()]
+        while queue:
+            parent = queue.pop()
+            for row in children.get(parent['id'], []):
+                node = cls._tree_fields(row.label, row[3:], parent)
+                node['id'] = row.id
+                mappings.append(node)
+                queue.append(node)
+        db.session.bulk_update_mappings(cls, mappings)
+
+    @classmethod
+    def _api_after_write(cls, action, id):
+        if action is Action.DELETE:
+            # Questions of deleted pages are removed by ON DELETE CASCADE.
+            Question.refresh_listing()
 
     @classmethod
     def is_label_vacant(cls, label, omit_regex=False, page_id=None):
@@ -382,15 +518,19 @@ class Page(CreatedModifiedMixin, TagsGetterMixin, ApiMixin, db.Model):
             query = query.filter(cls.id != page_id)
         return not query.count()
 
+    @staticmethod
+    def make_label(name):
+        dash = '-'
+        _name = name.strip().lower().replace(' ', dash)
+        label = transliterate.translit(_name, LANG, reversed=True)
+        return ''.join(ch for ch in label
+                       if ch.isalpha() or ch.isdigit() or ch == dash)
+
     @classmethod
     def pick_label_by_name(cls, name, page_id=None):
         if not name:
             return ''
-        dash = '-'
-        _name = name.strip().lower().replace(' ', dash)
-        label = transliterate.translit(_name, LANG, reversed=True)
-        candidate = ''.join(ch for ch in label
-                            if ch.isalpha() or ch.isdigit() or ch == dash)
+        candidate = cls.make_label(name)
 
         def construct(what, n):
             return '{}-{}'.format(what, n) if n > 0 else what
@@ -427,35 +567,70 @@ class Category(object):
         else:
             kinds = ['category', 'subcategory']
 
-        def key(p):
-            if p.kind == 'category':
-                return (p.priority, p.id, 0, 0)
-            return (p.parent.priority, p.parent.id, p.priority, p.id)
+        parent = sqlalchemy.orm.aliased(Page)
 
-        pages = db.session.query(Page).filter(Page.kind.in_(kinds)).all()
-        pages.sort(key=key)
-        return [cls(page) for page in pages]
+        def nested(then, else_):
+            return sqlalchemy.case([(Page.kind == 'subcategory', then)], else_=else_)
 
-    def _count(self, what):
-        if what == 'question':
-            return (
-                db.session.query(Question.id)
-                          .filter_by(parent_id=self.page.id).count()
-            )
-        return (
-            db.session.query(Page.id)
-                      .filter_by(kind=what)
-                      .filter_by(parent_id=self.page.id).count()
+        pages = (
+            db.session.query(Page)
+                      .join(parent, Page.parent)
+                      .options(sqlalchemy.orm.contains_eager(Page.parent.of_type(parent)))
+                      .filter(Page.kind.in_(kinds))
+                      .order_by(nested(parent.priority, Page.priority),
+                                nested(parent.id, Page.id),
+                                nested(Page.priority, 0),
+                                nested(Page.id, 0)).all()
         )
+        return [cls(page) for page in pages]
 
-    def count_questions(self):
-        return self._count('question')
-
-    def count_services(self):
-        return self._count('service')
+    @classmethod
+    def get_all_with_stats(cls, only_root=False):
+        categories = cls.get_all(only_root=only_root)
+        stats = cls._get_stats([c.page.id for c in categories])
+        empty = CategoryStats(0, 0, 0, 0, 0, 0)
+        for category in categories:
+            category.stats = stats.get(category.page.id, empty)
+        return categories
 
-    def count_papers(self):
-        return self._count('paper')
+    @staticmethod
+    def _get_stats(ids):
+        """
+        Services, papers and questions are put together with their
+        ancestors (the parent's ancestors and the parent for questions),
+        one row per ancestor. An item is counted for every category among
+        them, and directly for the one that is its parent.
+        """
+        if not ids:
+            return {}
+        func = sqlalchemy.func
+        parent = sqlalchemy.orm.aliased(Page)
+        items = sqlalchemy.union_all(
+            sqlalchemy.select([Page.kind, Page.parent_id,
+                               func.unnest(Page.ancestor_ids).label('category_id')])
+                      .where(Page.kind.in_(['service', 'paper'])),
+            sqlalchemy.select([sqlalchemy.literal('question').label('kind'),
+                               Question.parent_id,
+                               func.unnest(func.array_append(parent.ancestor_ids, parent.id))
+                                   .label('category_id')])
+                      .select_from(sqlalchemy.join(Question, parent,
+                                                   Question.parent_id == parent.id)),
+        ).alias('items')
+
+        count = func.count
+        direct = items.c.parent_id == items.c.category_id
+        counts = []
+        for kind in ['service', 'paper', 'question']:
+            counts.append(count().filter(sqlalchemy.and_(items.c.kind == kind, direct)))
+        for kind in ['service', 'paper', 'question']:
+            counts.append(count().filter(items.c.kind == kind))
+
+        rows = (
+            db.session.query(items.c.category_id, *counts)
+                      .filter(items.c.category_id.in_(ids))
+                      .group_by(items.c.category_id).all()
+        )
+        return {row[0]: CategoryStats(*row[1:]) for row in rows}
 
     def __repr__(self):
         return '<Category ({!r})>'.format(self.page)
@@ -473,6 +648,8 @@ class Question(db.Model, TagsGetterMixin, CreatedModifiedMixin, ApiMixin):
     content_question = Column(UnicodeText)
     content_answer   = Column(UnicodeText)
     author           = Column(UnicodeText)
+    # Plain-text meta description, derived from content_question on save.
+    description      = Column(UnicodeText, default='')
 
     tags = relationship('Tag', secondary=questions_and_tags_table,
                         lazy='joined', order_by='Tag.name')
@@ -498,43 +675,176 @@ class Question(db.Model, TagsGetterMixin, CreatedModifiedMixin, ApiMixin):
     def is_answer_provided(self):
         return bool(self.content_answer.strip())
 
-    def generate_page(self):
+    @staticmethod
+    def make_description(content_question):
         try:
-            soup = BeautifulSoup(self.content_question or '', HTML_PARSER)
-            description = jinja2.filters.do_truncate(
-                soup.get_text().strip(), length=170, killwords=False)
+            soup = BeautifulSoup(content_question or '', HTML_PARSER)
+            return app.jinja_env.call_filter(
+                'truncate', soup.get_text().strip(),
+                kwargs={'length': 170, 'killwords': False})
         except Exception:
             app.logger.exception('Error building description for a question.')
-            description = ''
+            return ''
+
+    def generate_page(self, parents=None):
         page = Page(kind='static',
                     heading=self.heading,
                     title=self.heading,
-                    description=description,
+                    description=self.description,
                     date_modified=self.date_modified)
-        main = Page.get_main()
-        seco = Page.get_by_label('question-answer')
-        page.breadcrumbs = [
-            Breadcrumb(main.heading, main.get_url()),
-            Breadcrumb(seco.heading, seco.get_url()),
-            Breadcrumb(page.heading, None),
-        ]
+        if parents is None:
+            main = Page.get_main()
+            seco = Page.get_by_label('question-answer')
+            parents = [
+                Breadcrumb(main.heading, main.get_url()),
+                Breadcrumb(seco.heading, seco.get_url()),
+            ]
+        page.breadcrumbs = list(parents) + [Breadcrumb(page.heading, None)]
         return page
 
+    @classmethod
+    def get_listing_page(cls, number, total, per_page=QUESTIONS_PER_PAGE):
+        # Blocks of the listing are counted from the oldest question, so
+        # newest first page ``number`` spans positions lower..upper of the
+        # ascending order and starts inside one block.
+        upper = total - 1 - (number - 1) * per_page
+        if upper < 0:
+            return []
+        lower = max(0, upper - per_page + 1)
+        block = lower // per_page
+        boundary = (
+            db.session.query(QuestionPageBoundary.first_id)
+                      .filter_by(number=block).as_scalar()
+        )
+        questions = (
+            db.session.query(cls)
+                      .filter(cls.id >= boundary)
+                      .order_by(cls.id)
+                      .offset(lower - block * per_page)
+                      .limit(upper - lower + 1).all()
+        )
+        return questions[::-1]
+
+    @classmethod
+    def refresh_listing(cls, per_page=QUESTIONS_PER_PAGE):
+        func = sqlalchemy.func
+        db.session.flush()
+        stats = cls._lock_stats()
+        if stats is None:
+            stats = QuestionStats(id=QuestionStats.ID)
+            db.session.add(stats)
+        db.session.query(QuestionPageBoundary).delete()
+
+        position = func.row_number().over(order_by=cls.id) - 1
+        numbered = sqlalchemy.select([cls.id.label('id'),
+                                      position.label('position')]).alias()
+        boundaries = (
+            sqlalchemy.select([numbered.c.position / per_page, numbered.c.id])
+                      .where(numbered.c.position % per_page == 0)
+        )
+        db.session.execute(QuestionPageBoundary.__table__.insert().from_select(
+            ['number', 'first_id'], boundaries))
+
+        stats.total = db.session.query(func.count(cls.id)).scalar()
+        stats.date_modified = arrow.utcnow()
+
+    @classmethod
+    def update_listing(cls, action, id, per_page=QUESTIONS_PER_PAGE):
+        """
+        Move the listing blocks after question ``id`` was added or removed:
+        only blocks starting after it shift by one question, so adding the
+        newest question touches at most the last block.
+        """
+        func = sqlalchemy.func
+        Boundary = QuestionPageBoundary
+        db.session.flush()
+        # Writers wait for each other here, so the total and
+        # the blocks always change together.
+        stats = cls._lock_stats()
+        if stats is None:
+            cls.refresh_listing(per_page)
+            return
+
+        if action is Action.CREATE:
+            stats.total += 1
+            previous = (
+                db.session.query(func.max(cls.id))
+                          .filter(cls.id < Boundary.first_id)
+                          .correlate(Boundary).as_scalar()
+            )
+            (db.session.query(Boundary)
+                       .filter(Boundary.first_id > id)
+                       .update({Boundary.first_id: previous}, synchronize_session=False))
+            if (stats.total - 1) % per_page == 0:
+                db.session.add(Boundary(number=(stats.total - 1) // per_page,
+                                        first_id=db.session.query(func.max(cls.id)).scalar()))
+        elif action is Action.DELETE:
+            stats.total -= 1
+            (db.session.query(Boundary)
+                       .filter(Boundary.number * per_page >= stats.total)
+                       .delete(synchronize_session=False))
+            following = (
+                db.session.query(func.min(cls.id))
+                          .filter(cls.id > Boundary.first_id)
+                          .correlate(Boundary).as_scalar()
+            )
+            (db.session.query(Boundary)
+                       .filter(Boundary.first_id >= id)
+                       .update({Boundary.first_id: following}, synchronize_session=False))
+        stats.date_modified = arrow.utcnow()
+
+    @staticmethod
+    def _lock_stats():
+        return (
+            db.session.query(QuestionStats)
+                      .populate_existing()
+                      .with_for_update()
+                      .get(QuestionStats.ID)
+        )
+
     @classmethod
     def _api_alter(cls, obj, data):
-        Tag.add_by_names(data['tags'])
-        obj.tags = Tag.get_by_names(data['tags'])
-        assert len(obj.tags) == len(data['tags'])
+        obj.set_tags(Tag.resolve(data['tags']))
 
         keys = ['heading', 'content_question', 'parent_id',
                 'content_answer', 'author', 'jurist_id']
         for key in keys:
             setattr(obj, key, data[key])
+        obj.description = cls.make_description(obj.content_question)
+
+    @classmethod
+    def _api_after_write(cls, action, id):
+        cls.update_listing(action, id)
 
     def __repr__(self):
         return '<Question {}>'.format(self.id)
 
 
+class QuestionStats(db.Model):
+    __tablename__ = 'question_stats'
+
+    ID = 1
+
+    id            = Column(Integer, CheckConstraint('id = 1'), primary_key=True)
+    total         = Column(Integer, default=0)
+    date_modified = Column(ArrowType(timezone=True), default=arrow.utcnow)
+
+    @classmethod
+    def get(cls):
+        return db.session.query(cls).get(cls.ID) or cls(id=cls.ID, total=0)
+
+
+class QuestionPageBoundary(db.Model):
+    """
+    Id of the oldest question in every block of QUESTIONS_PER_PAGE
+    questions, counting blocks from the oldest question.
+    """
+    __tablename__ = 'question_page_boundaries'
+
+    number   = Column(Integer, primary_key=True, autoincrement=False)
+    first_id = Column(Integer, index=True)
+
+
 class Jurist(db.Model):
     __tablename__ = 'jurists'
 
@@ -572,6 +882,89 @@ class Shortcode(db.Model, ApiMixin):
             setattr(obj, key, data[key])
 
 
+class OutboxLead(db.Model):
+    __tablename__ = 'lead_outbox'
+
+    id           = Column(Integer, primary_key=True)
+    date_created = Column(ArrowType(timezone=True), default=arrow.utcnow)
+
+    deliveries = relationship('LeadDelivery', backref='lead',
+                              order_by='LeadDelivery.id')
+
+    @classmethod
+    def enqueue(cls, payloads):
+        try:
+            lead = cls()
+            lead.deliveries = [LeadDelivery(target=target, payload=payload)
+                               for target, payload in sorted(payloads.items())]
+            db.session.add(lead)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return lead
+
+    def __repr__(self):
+        return '<OutboxLead {}>'.format(self.id)
+
+
+class LeadDelivery(db.Model):
+    __tablename__ = 'lead_deliveries'
+
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    id           = Column(Integer, primary_key=True)
+    lead_id      = Column(Integer, CascadeForeignKey('lead_outbox.id'))
+    target       = Column(String)
+    payload      = Column(JSONB)
+    status       = Column(String, default=PENDING)
+    attempts     = Column(Integer, default=0)
+    next_attempt = Column(ArrowType(timezone=True), default=arrow.utcnow)
+    last_error   = Column(UnicodeText, default='')
+    date_sent    = Column(ArrowType(timezone=True), nullable=True)
+
+    __table_args__ = (
+        CheckConstraint("status IN ('pending', 'sent', 'failed')"),
+        Index('index_pending_lead_deliveries', 'next_attempt',
+              postgresql_where=sqlalchemy.text("status = 'pending'")),
+    )
+
+    @classmethod
+    def claim(cls):
+        """
+        Lock the next due delivery; rows locked by other workers are skipped.
+        """
+        return (
+            db.session.query(cls)
+                      .filter_by(status=cls.PENDING)
+                      .filter(cls.next_attempt <= arrow.utcnow())
+                      .order_by(cls.next_attempt, cls.id)
+                      .with_for_update(skip_locked=True)
+                      .first()
+        )
+
+    def mark_sent(self):
+        self.attempts += 1
+        self.status = self.SENT
+        self.date_sent = arrow.utcnow()
+        self.last_error = ''
+
+    def mark_failed(self, error, max_attempts, retry_seconds, max_retry_seconds):
+        self.attempts += 1
+        self.last_error = u'{}: {}'.format(type(error).__name__, error)
+        if self.attempts >= max_attempts:
+            self.status = self.FAILED
+            return
+        delay = min(retry_seconds * 2 ** (self.attempts - 1), max_retry_seconds)
+        self.next_attempt = arrow.utcnow().shift(seconds=delay)
+
+    def __repr__(self):
+        return "<LeadDelivery ({}, '{}', '{}')>".format(self.lead_id, self.target,
+                                                        self.status)
+
+
 class User(db.Model):
     __tablename__ = 'users'
 
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+
+class PageNode(object):
+    """
+    Compact, read-only description of a page used for routing.
+    """
+
+    __slots__ = ('id', 'label', 'kind', 'parent_id', 'priority',
+                 'visible_in_menu', 'date_modified', 'heading', 'path',
+                 'has_visible_content')
+
+    def __init__(self, id, label, kind, parent_id, priority, visible_in_menu,
+                 date_modified=None, heading='', path='', has_visible_content=True):
+        self.id = id
+        self.label = label
+        self.kind = kind
+        self.parent_id = parent_id
+        self.priority = priority
+        self.visible_in_menu = visible_in_menu
+        self.date_modified = date_modified
+        self.heading = heading
+        self.path = path
+        self.has_visible_content = has_visible_content
+
+    def is_main(self):
+        return self.kind == 'main'
+
+    def should_be_404(self):
+        return self.kind in ['service'] and not self.has_visible_content
+
+    def is_parent_of(self, other):
+        return self.id == other.parent_id
+
+    def __repr__(self):
+        return "<PageNode ('{}', '{}')>".format(self.kind, self.label)
+
+
+class PageIndex(object):
+    """
+    Immutable in-memory index of the page tree.
+
+    A new index is built from scratch whenever pages change,
+    so readers never see a partially updated tree.
+    """
+
+    def __init__(self, nodes=()):
+        self._by_label = {}
+        self._by_id = {}
+        self._children = {}
+        for node in nodes:
+            self._by_label[node.label] = node
+            self._by_id[node.id] = node
+            self._children.setdefault(node.parent_id, []).append(node)
+        for children in self._children.values():
+            children.sort(key=lambda node: (node.priority, node.id))
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls(PageNode(*row) for row in rows)
+
+    def get(self, label):
+        return self._by_label.get(label)
+
+    def get_by_id(self, id):
+        return self._by_id.get(id)
+
+    def get_children(self, parent_id):
+        """
+        Children of the page, ordered by priority.
+        """
+        return self._children.get(parent_id, [])
+
+    def get_parents(self, node):
+        """
+        Ancestors of the node, nearest first.
+        """
+        parents = []
+        parent = self._by_id.get(node.parent_id)
+        while parent is not None:
+            parents.append(parent)
+            parent = self._by_id.get(parent.parent_id)
+        return parents
+
+    def resolve(self, category, subcategory=None, article=None):
+        """
+        Find the node addressed by URL labels, checking kinds and
+        parent links the same way the URL cascade always did.
+        """
+        parts = (category, subcategory, article)
+        nodes = tuple(None if label is None else self.get(label) for label in parts)
+        if any(node is None for label, node in zip(parts, nodes) if label is not None):
+            return None
+
+        first, second, third = nodes
+        if subcategory is None and article is None:
+            if first.kind in ['main', 'static', 'category']:
+                return first
+        elif article is None:
+            if first.kind == 'category' and first.is_parent_of(second):
+                return second
+        elif subcategory is not None:
+            if (first.kind == 'category' and
+                    second.kind == 'subcategory' and
+                    first.is_parent_of(second) and
+                    second.is_parent_of(third)):
+                return third
+        return None
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __repr__(self):
+        return '<PageIndex ({} pages)>'.format(len(self))
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import time
+
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Bound parameters and literal numbers, then lists of them (IN clauses).
+PARAMETER = re.compile(r"%\(\w+\)s|%s|\?|\b\d+\b")
+PARAMETER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+def statement_shape(statement):
+    """
+    Statement with parameters replaced, so that queries differing
+    only in their parameters have the same shape.
+    """
+    return PARAMETER_LIST.sub('?', PARAMETER.sub('?', statement))
+
+
+class RequestStats(object):
+    def __init__(self):
+        self.queries = 0
+        self.time = 0.0
+        self.shapes = {}
+        self.flagged = set()
+
+
+class QueryStats(object):
+    """
+    Number and duration of SQL statements run by each request.
+
+    Enabled in debug mode or with the QUERY_STATS config option. The
+    totals are sent in X-DB-Queries and X-DB-Time (milliseconds) headers
+    in debug mode. A statement repeated ``threshold`` times with the same
+    shape in one request is logged as a probable N+1, together with the
+    template or view line it came from.
+    """
+
+    def __init__(self, app, logger, threshold=5):
+        self.app = app
+        self.logger = logger
+        self.threshold = threshold
+        self.root = os.path.dirname(os.path.abspath(__file__))
+        self.own_file = os.path.abspath(__file__)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+
+    def is_enabled(self):
+        return self.app.debug or self.app.config.get('QUERY_STATS', False)
+
+    def _start(self):
+        if self.is_enabled():
+            g.query_stats = RequestStats()
+
+    def _finish(self, response):
+        stats = g.get('query_stats')
+        if stats is not None and self.app.debug:
+            response.headers['X-DB-Queries'] = str(stats.queries)
+            response.headers['X-DB-Time'] = '{:.1f}'.format(stats.time * 1000)
+        return response
+
+    def _get(self):
+        if not has_app_context():
+            return None
+        return g.get('query_stats')
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the execution context, which is dropped
+        # together with the start time if the statement fails.
+        if self._get() is not None and context is not None:
+            context._query_stats_start = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self._get()
+        started = getattr(context, '_query_stats_start', None)
+        if stats is None or started is None:
+            return
+        stats.queries += 1
+        stats.time += time.perf_counter() - started
+
+        shape = statement_shape(statement)
+        count = stats.shapes.get(shape, 0) + 1
+        stats.shapes[shape] = count
+        if count >= self.threshold and shape not in stats.flagged:
+            stats.flagged.add(shape)
+            self.logger.warning(
+                'Probable N+1: statement repeated {} times at {}:\n{}'.format(
+                    count, self.find_origin(), shape))
+
+    def find_origin(self):
+        """
+        Innermost line of the application's own code and innermost
+        template line that led to the current statement.
+        """
+        frame = sys._getframe()
+        code = template = None
+        while frame is not None and template is None:
+            jinja_template = frame.f_globals.get('__jinja_template__')
+            filename = os.path.abspath(frame.f_code.co_filename)
+            if jinja_template is not None:
+                template = 'template {} line {}'.format(
+                    jinja_template.name or '<string>',
+                    jinja_template.get_corresponding_lineno(frame.f_lineno))
+            elif (code is None and filename.startswith(self.root) and
+                    filename != self.own_file and 'site-packages' not in filename):
+                code = '{} line {} in {}'.format(
+                    os.path.relpath(filename, self.root), frame.f_lineno,
+                    frame.f_code.co_name)
+            frame = frame.f_back
+        return ', '.join(place for place in (code, template) if place) or 'unknown location'
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import functools
+
+from flask import g, request, make_response, Response
+
+from versions import EVERYTHING
+
+
+class ResponseCache(object):
+    """
+    Rendered public responses tagged with the content they depend on.
+
+    While a cached view renders, it calls ``tag()`` for every piece of
+    content it uses (``page:<id>``, ``question:<id>``, ``shortcodes``...).
+    The versions of those tags are stored with the response, and the entry
+    is served only while all of them are unchanged, so bumping a tag drops
+    exactly the responses depending on it. Every response also depends
+    on the ``all`` tag, which drops them all at once.
+    """
+
+    KEY_PREFIX = 'response:'
+
+    def __init__(self, cache, versions, logger):
+        self.cache = cache
+        self.versions = versions
+        self.logger = logger
+
+    def tag(self, *names):
+        tags = g.get('cache_tags')
+        if tags is None:
+            return
+        for name in names:
+            if name not in tags:
+                tags[name] = self.versions.get(name)
+
+    def invalidate(self, *names):
+        self.versions.bump(*names)
+
+    def get(self, key):
+        try:
+            entry = self.cache.get(self.KEY_PREFIX + key)
+        except Exception:
+            self.logger.exception('Could not read cached response.')
+            return None
+        if entry is None:
+            return None
+        names, stamp, status, headers, data = entry
+        if self.versions.get_many(names) != stamp:
+            return None
+        return Response(data, status=status, headers=headers)
+
+    def set(self, key, response, tags):
+        names = tuple(sorted(tags))
+        stamp = tuple(tags[name] for name in names)
+        entry = (names, stamp, response.status_code,
+                 list(response.headers), response.get_data())
+        try:
+            self.cache.set(self.KEY_PREFIX + key, entry)
+        except Exception:
+            self.logger.exception('Could not store response in cache.')
+
+    def cached(self, view):
+        """
+        Serve the view from cache; responses are stored only
+        if they are successful and tagged.
+        """
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if 'cache_tags' in g or request.method != 'GET':
+                return view(*args, **kwargs)
+            key = request.url
+            response = self.get(key)
+            if response is not None:
+                return response.make_conditional(request)
+            g.cache_tags = {}
+            everything = self.versions.get(EVERYTHING)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and g.cache_tags:
+                g.cache_tags.setdefault(EVERYTHING, everything)
+                self.set(key, response, g.cache_tags)
+            return response
+        return wrapper
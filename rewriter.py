@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk rewrite of stored content in bounded batches.
+
+    python3 rewriter.py [--dry-run] [--restart] [--jobs N] TRANSFORM...
+
+Rows are read in id order, BATCH_SIZE at a time, and passed through the
+registered transforms in a pool of worker processes. Every batch is
+written and committed on its own, and the last committed id is saved in
+a progress file, so an interrupted run continues where it stopped.
+With --dry-run nothing is written and only the changes are counted.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+from collections import OrderedDict, namedtuple
+
+import flaskapp
+from flaskapp import db
+import models
+import utils
+import versions
+
+BATCH_SIZE = 500
+CHUNK_SIZE = 50
+JOBS = os.cpu_count() or 1
+
+Transform = namedtuple('Transform', 'name, model, columns, function')
+
+# Applied in registration order, so a transform sees
+# the output of the ones registered before it.
+TRANSFORMS = []
+
+
+def transform(name, model, columns):
+    """
+    Register ``function(row) -> dict of new values`` as ``name`` for
+    ``model``. ``row`` maps ``columns`` (and ``id``) to their values;
+    the function may return only these columns, so list the ones it
+    writes too. Functions run in worker processes and must not touch
+    the database.
+    """
+    def decorator(function):
+        TRANSFORMS.append(Transform(name, model, columns, function))
+        return function
+    return decorator
+
+
+@transform('links', models.Page, ['content'])
+def page_links(row):
+    return {'content': utils._postprocess_html(row['content'])}
+
+
+@transform('links', models.Question, ['content_question', 'content_answer'])
+def question_links(row):
+    return {
+        'content_question': utils._postprocess_html(row['content_question']),
+        'content_answer': utils._postprocess_html(row['content_answer']),
+    }
+
+
+@transform('visibility', models.Page, ['content', 'has_visible_content'])
+def page_visibility(row):
+    return {'has_visible_content': not models.Page.is_html_empty(row['content'], strip_tags=True)}
+
+
+@transform('description', models.Question, ['content_question', 'description'])
+def question_description(row):
+    return {'description': models.Question.make_description(row['content_question'])}
+
+
+def get_transforms(names):
+    """
+    Selected transforms grouped by model.
+    """
+    unknown = set(names) - {t.name for t in TRANSFORMS}
+    if unknown:
+        raise ValueError('Unknown transforms: {}'.format(', '.join(sorted(unknown))))
+    grouped = OrderedDict()
+    for t in TRANSFORMS:
+        if t.name in names:
+            grouped.setdefault(t.model, []).append(t)
+    return grouped
+
+
+def _apply_chunk(args):
+    """
+    Run in a worker: return ``(id, changed values)`` of rows that change.
+    """
+    table, names, rows = args
+    functions = [t.function for t in TRANSFORMS
+                 if t.model.__tablename__ == table and t.name in names]
+    result = []
+    for row in rows:
+        current = dict(row)
+        for function in functions:
+            current.update(function(current))
+        changed = {key: value for key, value in current.items() if row[key] != value}
+        if changed:
+            result.append((row['id'], changed))
+    return result
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _load_progress(path, names):
+    try:
+        with open(path) as f:
+            progress = json.load(f)
+    except FileNotFoundError:
+        return {'transforms': sorted(names), 'last_ids': {}}
+    if progress['transforms'] != sorted(names):
+        raise ValueError('{} belongs to a run of {}; use --restart to discard it'
+                         .format(path, ', '.join(progress['transforms'])))
+    return progress
+
+
+def _save_progress(path, progress):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.part', 'w') as f:
+        json.dump(progress, f)
+    os.replace(path + '.part', path)
+
+
+def get_progress_path(names):
+    return os.path.join(flaskapp.CACHE_DIR, 'rewrite-{}.json'.format('-'.join(sorted(names))))
+
+
+def rewrite_model(pool, model, transforms, names, last_id=0, dry_run=False,
+                  on_batch=None):
+    """
+    Rewrite rows of ``model`` with ids above ``last_id``.
+    Returns the number of scanned and changed rows.
+    """
+    columns = sorted({column for t in transforms for column in t.columns})
+    entities = [model.id] + [getattr(model, column) for column in columns]
+    scanned = changed = 0
+    while True:
+        try:
+            query = (db.session.query(*entities)
+                     .filter(model.id > last_id)
+                     .order_by(model.id)
+                     .limit(BATCH_SIZE))
+            if not dry_run:
+                # Editors saving one of these rows wait for the batch
+                # instead of having their changes overwritten.
+                query = query.with_for_update(of=model)
+            rows = [dict(zip(['id'] + columns, row)) for row in query]
+            if not rows:
+                db.session.rollback()
+                break
+
+            chunks = [(model.__tablename__, names, chunk)
+                      for chunk in _chunks(rows, CHUNK_SIZE)]
+            mappings = []
+            for result in pool.map(_apply_chunk, chunks):
+                for id, values in result:
+                    values['id'] = id
+                    mappings.append(values)
+
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.bulk_update_mappings(model, mappings)
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        last_id = rows[-1]['id']
+        scanned += len(rows)
+        changed += len(mappings)
+        if on_batch is not None:
+            on_batch(last_id)
+    return scanned, changed
+
+
+def rewrite(names, dry_run=False, restart=False, jobs=JOBS, progress_path=None):
+    """
+    Apply transforms ``names`` to all rows they are registered for.
+    Returns ``{table: (scanned, changed)}``.
+    """
+    grouped = get_transforms(names)
+    progress_path = progress_path or get_progress_path(names)
+    if restart and os.path.exists(progress_path):
+        os.remove(progress_path)
+    progress = _load_progress(progress_path, names)
+
+    # Workers are forked right away, before any database connection
+    # is open, so that they don't share the parent's connections.
+    db.session.remove()
+    db.engine.dispose()
+
+    results = OrderedDict()
+    with multiprocessing.get_context('fork').Pool(jobs) as pool:
+        for model, transforms in grouped.items():
+            table = model.__tablename__
+
+            def on_batch(last_id, table=table):
+                if not dry_run:
+                    progress['last_ids'][table] = last_id
+                    _save_progress(progress_path, progress)
+
+            results[table] = rewrite_model(
+                pool, model, transforms, names,
+                last_id=progress['last_ids'].get(table, 0),
+                dry_run=dry_run, on_batch=on_batch)
+
+    if not dry_run:
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+        flaskapp.page_index.invalidate()
+        flaskapp.response_cache.invalidate(versions.EVERYTHING)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('transforms', nargs='+', metavar='TRANSFORM',
+                        choices=sorted({t.name for t in TRANSFORMS}))
+    parser.add_argument('--dry-run', action='store_true',
+                        help='count rows that would change without writing them')
+    parser.add_argument('--restart', action='store_true',
+                        help='ignore the progress of an interrupted run')
+    parser.add_argument('--jobs', type=int, default=JOBS)
+    args = parser.parse_args()
+
+    with flaskapp.app.app_context():
+        results = rewrite(args.transforms, dry_run=args.dry_run,
+                          restart=args.restart, jobs=args.jobs)
+    for table, (scanned, changed) in results.items():
+        print('{}: {} of {} rows {}'.format(
+            table, changed, scanned, 'would change' if args.dry_run else 'changed'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+# Shortcode keys are constrained by LABEL_REGEX in the database,
+# so a single token pattern finds every candidate in one scan.
+SHORTCODE_TOKEN = re.compile(r'\[([a-z0-9-]+)\]')
+
+
+class ShortcodeSnapshot(object):
+    """
+    Immutable set of shortcode values used while rendering public pages.
+
+    Substitution is done in a single pass: every ``[key]`` token is looked
+    up in the snapshot, unknown tokens are left untouched and values are
+    never substituted recursively.
+    """
+
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+
+    def get(self, code, default=None):
+        return self.values.get(code) or default
+
+    def _substitute(self, match):
+        value = self.values.get(match.group(1))
+        return match.group(0) if value is None else value
+
+    def replace(self, text):
+        if not self.values or '[' not in text:
+            return text
+        return SHORTCODE_TOKEN.sub(self._substitute, text)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return '<ShortcodeSnapshot ({} codes)>'.format(len(self.values))
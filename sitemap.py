@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+
+import sqlalchemy
+from sqlalchemy import func
+from flask import url_for
+
+from flaskapp import db
+import models
+
+# Limit of URLs in a single sitemap file set by sitemaps.org protocol.
+MAX_URLS = 50000
+YIELD_PER = 2000
+LASTMOD_FORMAT = 'YYYY-MM-DDTHH:mm:ssZZ'
+_ID_MARKER = 987654321
+
+Segment = namedtuple('Segment', 'number, kind, first_id, last_id, count, date_modified')
+
+
+def _chunks(model, condition):
+    chunk = (func.row_number().over(order_by=model.id) - 1) / MAX_URLS
+    numbered = (
+        db.session.query(model.id.label('id'),
+                         model.date_modified.label('date_modified'),
+                         chunk.label('chunk'))
+                  .filter(condition).subquery()
+    )
+    return (
+        db.session.query(func.min(numbered.c.id), func.max(numbered.c.id),
+                         func.count(), func.max(numbered.c.date_modified))
+                  .group_by(numbered.c.chunk)
+                  .order_by(numbered.c.chunk).all()
+    )
+
+
+def get_segments():
+    """
+    Split sitemap URLs into id ranges of at most MAX_URLS rows,
+    pages first, each with its latest modification date.
+    """
+    sources = [
+        ('pages', models.Page, models.Page.sitemap_condition()),
+        ('questions', models.Question, sqlalchemy.true()),
+    ]
+    segments = []
+    for kind, model, condition in sources:
+        for row in _chunks(model, condition):
+            segments.append(Segment(len(segments) + 1, kind, *row))
+    return segments
+
+
+def _page_urls(first_id, last_id):
+    Page = models.Page
+    root = url_for('render_index', _external=True)
+    query = (
+        db.session.query(Page.id, Page.kind, Page.path, Page.date_modified)
+                  .filter(Page.sitemap_condition())
+                  .filter(Page.id.between(first_id, last_id))
+                  .order_by(Page.id)
+    )
+    for id, kind, path, modified in query.yield_per(YIELD_PER):
+        url = root if kind == 'main' else '{}{}/'.format(root, path)
+        yield url, modified.format(LASTMOD_FORMAT)
+
+
+def _question_urls(first_id, last_id):
+    Question = models.Question
+    template = (url_for('render_single_question', id=_ID_MARKER, _external=True)
+                .replace(str(_ID_MARKER), '{}'))
+    query = (
+        db.session.query(Question.id, Question.date_modified)
+                  .filter(Question.id.between(first_id, last_id))
+                  .order_by(Question.id)
+    )
+    for id, modified in query.yield_per(YIELD_PER):
+        yield template.format(id), modified.format(LASTMOD_FORMAT)
+
+
+def generate_urls(segments):
+    """
+    Yield (loc, lastmod) pairs of the segments, streaming rows
+    from a server-side cursor one segment at a time.
+    """
+    generators = {'pages': _page_urls, 'questions': _question_urls}
+    for segment in segments:
+        for item in generators[segment.kind](segment.first_id, segment.last_id):
+            yield item
+
+
+def get_date_modified(segments):
+    dates = [s.date_modified for s in segments if s.date_modified is not None]
+    return max(dates) if dates else None
+
+
+def buffered(chunks, size=64 * 1024):
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
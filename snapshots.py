@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental content snapshots as gzipped JSON Lines.
+
+    python3 snapshots.py export DIRECTORY [--full]
+    python3 snapshots.py import DIRECTORY [--until SNAPSHOT]
+
+The first export (or one with --full) writes every row of the content
+tables. Later exports write only rows changed since the previous one:
+pages and questions are selected by date_modified, their tag links are
+rewritten for every page and question selected, small tables without
+timestamps are compared by row checksums. Rows that disappeared are
+written as tombstones. What the last export saw is kept in state.json
+in the same directory.
+
+Import replays the latest full snapshot and every increment after it
+into a database created with utils.init_db().
+"""
+
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import os
+from collections import OrderedDict, namedtuple
+
+import arrow
+import sqlalchemy
+from sqlalchemy.dialects import postgresql
+
+import flaskapp
+from flaskapp import db
+import models
+import versions
+
+YIELD_PER = 2000
+BATCH_SIZE = 500
+# Rows stamped shortly before an export may be committed after it
+# started, so every increment also covers this much of the previous one.
+WATERMARK_OVERLAP = datetime.timedelta(minutes=10)
+STATE_FILE = 'state.json'
+PREFIX = 'snapshot-'
+SUFFIX = '.jsonl.gz'
+NAME_FORMAT = 'YYYYMMDDTHHmmss'
+
+# ``modified`` is the column to select changed rows by; ``parent`` is
+# the source and the column of the rows a link table belongs to. Other
+# tables are small and compared by row checksums.
+Source = namedtuple('Source', 'table, modified, order_by, parent')
+
+
+def get_sources():
+    """
+    Exported tables, parents before children.
+    """
+    Page = models.Page
+    depth = sqlalchemy.func.coalesce(sqlalchemy.func.array_length(Page.ancestor_ids, 1), 0)
+    pages = Source(Page.__table__, Page.__table__.c.date_modified, [depth, Page.id], None)
+    questions = Source(models.Question.__table__,
+                       models.Question.__table__.c.date_modified, None, None)
+    pages_and_tags = models.pages_and_tags_table
+    questions_and_tags = models.questions_and_tags_table
+    return [
+        Source(models.Jurist.__table__, None, None, None),
+        Source(models.Shortcode.__table__, None, None, None),
+        Source(models.Tag.__table__, None, None, None),
+        # Parent pages have to be inserted before their children.
+        pages,
+        questions,
+        Source(pages_and_tags, None, None, (pages, pages_and_tags.c.page_id)),
+        Source(questions_and_tags, None, None, (questions, questions_and_tags.c.question_id)),
+    ]
+
+
+def _encode(value):
+    if isinstance(value, (arrow.Arrow, datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def _row_dict(row):
+    return OrderedDict((key, _encode(value)) for key, value in row.items())
+
+
+def _key(table, row):
+    return ','.join(str(row[column.name]) for column in table.primary_key)
+
+
+def _checksum(row):
+    data = json.dumps(row, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def _stream(query):
+    result = db.session.connection().execution_options(stream_results=True).execute(query)
+    while True:
+        rows = result.fetchmany(YIELD_PER)
+        if not rows:
+            break
+        for row in rows:
+            yield row
+
+
+def _load_state(directory):
+    try:
+        with open(os.path.join(directory, STATE_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_state(directory, state):
+    path = os.path.join(directory, STATE_FILE)
+    with open(path + '.part', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.part', path)
+
+
+def _id_ranges(ids):
+    """
+    Sorted ids as ``[first, last]`` ranges, the way state.json keeps them.
+    """
+    ranges = []
+    for id in ids:
+        if ranges and ranges[-1][1] + 1 == id:
+            ranges[-1][1] = id
+        else:
+            ranges.append([id, id])
+    return ranges
+
+
+def _missing_ids(old, new):
+    """
+    Ids covered by ranges ``old`` and not by ranges ``new``.
+    """
+    new = iter(new)
+    current = next(new, None)
+    for first, last in old:
+        id = first
+        while id <= last:
+            while current is not None and current[1] < id:
+                current = next(new, None)
+            if current is not None and current[0] <= id:
+                id = current[1] + 1
+                continue
+            end = last if current is None else min(last, current[0] - 1)
+            for missing in range(id, end + 1):
+                yield missing
+            id = end + 1
+
+
+def _modified(source, since):
+    query = sqlalchemy.select([source.table])
+    if since is not None:
+        query = query.where(source.modified > since)
+    return query
+
+
+def _collect(source, previous, since):
+    """
+    Changed rows, keys of deleted rows, parents whose links are rewritten
+    and the new state of a table.
+    """
+    table = source.table
+    columns = [column for column in table.primary_key]
+    if source.parent is not None:
+        parent, column = source.parent
+        query = sqlalchemy.select([table]).order_by(*columns)
+        cleared = []
+        if since is not None:
+            ids = _modified(parent, since).with_only_columns([parent.table.c.id])
+            query = query.where(column.in_(ids))
+            cleared = (row.id for row in _stream(ids.order_by(parent.table.c.id)))
+        return (_row_dict(row) for row in _stream(query)), [], cleared, {}
+
+    if source.modified is None:
+        old = previous.get('checksums', {}) if previous else {}
+        checksums = {}
+        changed = []
+        for row in _stream(sqlalchemy.select([table]).order_by(*columns)):
+            row = _row_dict(row)
+            key = _key(table, row)
+            checksums[key] = _checksum(row)
+            if old.get(key) != checksums[key]:
+                changed.append(row)
+        deleted = [key for key in old if key not in checksums]
+        return changed, deleted, [], {'checksums': checksums}
+
+    id = table.c.id
+    ranges = _id_ranges(row.id for row in _stream(sqlalchemy.select([id]).order_by(id)))
+    old = previous.get('ids', []) if previous else []
+    deleted = [str(missing) for missing in _missing_ids(old, ranges)]
+    query = _modified(source, since).order_by(*(source.order_by or columns))
+    changed = (_row_dict(row) for row in _stream(query))
+    return changed, deleted, [], {'ids': ranges}
+
+
+def export(directory, full=False):
+    """
+    Write a snapshot into ``directory`` and return its file name.
+    """
+    os.makedirs(directory, exist_ok=True)
+    state = _load_state(directory)
+    if state is None:
+        full = True
+    started = arrow.utcnow()
+    name = '{}{}-{}{}'.format(PREFIX, started.format(NAME_FORMAT),
+                              'full' if full else 'incremental', SUFFIX)
+    path = os.path.join(directory, name)
+    since = None if full else arrow.get(state['watermark']) - WATERMARK_OVERLAP
+
+    try:
+        # All tables are read from the same consistent snapshot.
+        db.session.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        watermark = arrow.get(db.session.execute('SELECT now()').scalar())
+        header = {
+            'name': name,
+            'kind': 'full' if full else 'incremental',
+            'base': None if full else state['name'],
+            'watermark': watermark.isoformat(),
+        }
+        new_state = {'name': name, 'watermark': watermark.isoformat(), 'tables': {}}
+        tables = state['tables'] if not full else {}
+
+        collected = []
+        for source in get_sources():
+            changed, deleted, cleared, table_state = _collect(
+                source, tables.get(source.table.name), since)
+            new_state['tables'][source.table.name] = table_state
+            collected.append((source.table.name, changed, deleted, cleared))
+
+        with gzip.open(path + '.part', 'wt', encoding='utf-8') as f:
+            def write(record):
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write('\n')
+
+            write({'snapshot': header})
+            # Children are deleted before their parents,
+            # and everything is deleted before anything is inserted.
+            for table, _, deleted, cleared in reversed(collected):
+                for key in deleted:
+                    write({'table': table, 'delete': key})
+                for id in cleared:
+                    write({'table': table, 'clear': id})
+            for table, changed, _, _ in collected:
+                for row in changed:
+                    write({'table': table, 'row': row})
+        os.replace(path + '.part', path)
+    finally:
+        db.session.rollback()
+
+    _save_state(directory, new_state)
+    return name
+
+
+def get_chain(directory, until=None):
+    """
+    Names of the latest full snapshot and the increments after it.
+    """
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith(PREFIX) and name.endswith(SUFFIX))
+    if until is not None:
+        names = [name for name in names if name <= until]
+    full = [i for i, name in enumerate(names) if name.endswith('-full' + SUFFIX)]
+    if not full:
+        raise ValueError('No full snapshot in {}'.format(directory))
+    return names[full[-1]:]
+
+
+def _read(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _upsert(source, rows):
+    table = source.table
+    insert = postgresql.insert(table)
+    keys = [column.name for column in table.primary_key]
+    others = [column.name for column in table.columns if column.name not in keys]
+    if others:
+        insert = insert.on_conflict_do_update(
+            index_elements=keys, set_={name: insert.excluded[name] for name in others})
+    else:
+        insert = insert.on_conflict_do_nothing(index_elements=keys)
+    db.session.execute(insert, rows)
+
+
+def _delete(source, keys):
+    columns = list(source.table.primary_key)
+    values = [tuple(int(part) for part in key.split(',')) for key in keys]
+    db.session.execute(source.table.delete().where(sqlalchemy.tuple_(*columns).in_(values)))
+
+
+def _clear(source, ids):
+    _, column = source.parent
+    db.session.execute(source.table.delete().where(column.in_(ids)))
+
+
+def _apply(path, previous):
+    sources = {source.table.name: source for source in get_sources()}
+    operations = {'delete': _delete, 'clear': _clear, 'row': _upsert}
+    records = _read(path)
+    header = next(records)['snapshot']
+    if header['kind'] == 'incremental' and header['base'] != previous:
+        raise ValueError('{} follows {}, not {}'.format(header['name'], header['base'], previous))
+    if header['kind'] == 'full':
+        for source in reversed(get_sources()):
+            db.session.execute(source.table.delete())
+
+    batch, batch_kind = [], None
+
+    def flush():
+        if batch:
+            table, op = batch_kind
+            operations[op](sources[table], list(batch))
+            del batch[:]
+
+    for record in records:
+        op = next(op for op in operations if op in record)
+        kind, item = (record['table'], op), record[op]
+        if kind != batch_kind or len(batch) >= BATCH_SIZE:
+            flush()
+            batch_kind = kind
+        batch.append(item)
+    flush()
+    return header['name']
+
+
+def _reset_sequences():
+    for source in get_sources():
+        table = source.table
+        if 'id' in table.c:
+            db.session.execute(
+                "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                "coalesce((SELECT max(id) FROM {0}), 0) + 1, false)".format(table.name))
+
+
+def import_chain(directory, until=None):
+    """
+    Replay the latest full snapshot and its increments, one transaction
+    per snapshot. Returns the names of the applied snapshots.
+    """
+    names = get_chain(directory, until=until)
+    previous = None
+    for name in names:
+        try:
+            previous = _apply(os.path.join(directory, name), previous)
+            _reset_sequences()
+            models.Question.refresh_listing()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    flaskapp.shortcode_cache.invalidate()
+    flaskapp.page_index.invalidate()
+    flaskapp.tag_index.invalidate()
+    flaskapp.response_cache.invalidate(versions.EVERYTHING)
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command')
+    export_parser = commands.add_parser('export', help='write a snapshot')
+    export_parser.add_argument('directory')
+    export_parser.add_argument('--full', action='store_true',
+                               help='write all rows, not only changes')
+    import_parser = commands.add_parser('import', help='replay snapshots')
+    import_parser.add_argument('directory')
+    import_parser.add_argument('--until', help='last snapshot to replay')
+    args = parser.parse_args()
+
+    with flaskapp.app.app_context():
+        if args.command == 'export':
+            print(export(args.directory, full=args.full))
+        elif args.command == 'import':
+            for name in import_chain(args.directory, until=args.until):
+                print(name)
+        else:
+            parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
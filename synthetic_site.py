@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic site of a given size for the benchmarks and the tests, and a
+counter of the SQL statements run against it.
+"""
+
+import sqlalchemy
+
+from flaskapp import db
+import models
+import utils
+
+BATCH_SIZE = 5000
+TAGS = 1000
+SHORTCODES = 100
+
+
+def page_row(id, label, kind, parent, priority=0, content=None):
+    aux = ['', '', ''] if parent is not None else [u'Москва', u'8 800 000-00-00', '']
+    row = {
+        'id': id,
+        'label': label,
+        'heading': label.replace('-', ' ').capitalize(),
+        'title': u'Заголовок {}'.format(label),
+        'description': u'Описание {}'.format(label),
+        'content': content if content is not None else (
+            u'<p>Юридическая консультация по теме {}. Телефон [phone-{}].</p>'
+            .format(label, id % SHORTCODES) * 5),
+        'kind': kind,
+        'priority': priority,
+        'visible_in_menu': True,
+        'parent_id': None if parent is None else parent['id'],
+        'parent_kind': None if parent is None else parent['kind'],
+        'has_visible_content': content != '',
+    }
+    row.update(zip(models.AUX_FIELDS, aux))
+    row.update(models.Page._tree_fields(label, aux, parent))
+    return row
+
+
+def generate_pages(size):
+    """
+    Main and question-answer pages, categories, subcategories and
+    services and papers spread evenly between them; every tenth
+    service is empty (served as 404).
+    """
+    pages = [page_row(1, 'main', 'main', None)]
+    main = pages[0]
+    pages.append(page_row(2, 'question-answer', 'static', main))
+    ids = iter(range(3, size + 1))
+    categories = [page_row(next(ids), 'category-{}'.format(n), 'category', main, n)
+                  for n in range(max(1, size // 100))]
+    subcategories = [page_row(next(ids), 'subcategory-{}'.format(n), 'subcategory',
+                              categories[n % len(categories)], n)
+                     for n in range(max(1, size // 20))]
+    pages += categories + subcategories
+    for n, id in enumerate(ids):
+        parent = subcategories[n % len(subcategories)]
+        if n % 5 == 4:
+            pages.append(page_row(id, 'paper-{}'.format(n), 'paper', parent, n))
+        else:
+            content = '' if n % 10 == 9 else None
+            pages.append(page_row(id, 'service-{}'.format(n), 'service', parent, n, content))
+    return pages
+
+
+def build_site(pages, questions):
+    """
+    Fill the wiped database: pages in multi-row batches,
+    questions and tags with set-based statements.
+    """
+    utils.init_db()
+    try:
+        rows = generate_pages(pages)
+        for start in range(0, len(rows), BATCH_SIZE):
+            db.session.execute(models.Page.__table__.insert().values(rows[start:start + BATCH_SIZE]))
+        db.session.execute("SELECT setval(pg_get_serial_sequence('pages', 'id'), :id)",
+                           {'id': len(rows)})
+
+        db.session.execute(models.Shortcode.__table__.insert().values([
+            {'key': 'phone-{}'.format(n), 'value': u'8 800 {:03d}-00-00'.format(n), 'comment': ''}
+            for n in range(SHORTCODES)]))
+        db.session.execute(models.Tag.__table__.insert().values([
+            {'name': u'Тег {}'.format(n)} for n in range(TAGS)]))
+
+        parents = [row['id'] for row in rows if row['kind'] in ('category', 'subcategory')]
+        db.session.execute(
+            """
+            INSERT INTO questions (parent_id, jurist_id, heading, content_question,
+                                   content_answer, author, description,
+                                   date_created, date_modified)
+            SELECT (:parents)[1 + n % cardinality(:parents)], 1,
+                   'Вопрос номер ' || n,
+                   '<p>Текст вопроса номер ' || n || '. [phone-1]</p>',
+                   '<p>Ответ на вопрос номер ' || n || '.</p>',
+                   'Автор ' || n,
+                   'Текст вопроса номер ' || n,
+                   now() - n * interval '1 minute', now() - n * interval '1 minute'
+            FROM generate_series(1, :count) AS n
+            """, {'parents': parents, 'count': questions})
+        db.session.execute(
+            """
+            INSERT INTO questions_and_tags (question_id, tag_id)
+            SELECT q.id, t.id FROM questions q
+            JOIN tags t ON t.id IN (1 + q.id % :tags, 1 + (q.id / 7) % :tags)
+            """, {'tags': TAGS})
+        db.session.execute(
+            """
+            INSERT INTO pages_and_tags (page_id, tag_id)
+            SELECT p.id, 1 + p.id % :tags FROM pages p WHERE p.kind <> 'main'
+            """, {'tags': TAGS})
+        models.Question.refresh_listing()
+        db.session.commit()
+        db.session.execute('ANALYZE')
+    except Exception:
+        db.session.rollback()
+        raise
+    return rows
+
+
+class QueryCounter(object):
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        sqlalchemy.event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+    def stop(self):
+        sqlalchemy.event.remove(self.engine, 'before_cursor_execute', self._count)
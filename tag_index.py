@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+
+
+class TagIndex(object):
+    """
+    Immutable in-memory prefix index of tag names.
+
+    Names are kept sorted by their lower-cased form, so all names
+    starting with a prefix form one contiguous run found by bisection.
+    """
+
+    def __init__(self, names=()):
+        pairs = sorted((name.lower(), name) for name in names)
+        self._keys = [key for key, _ in pairs]
+        self._names = [name for _, name in pairs]
+
+    def complete(self, prefix, limit):
+        """
+        Up to ``limit`` names starting with ``prefix``, case-insensitively,
+        in alphabetical order (so an exact match comes first).
+        """
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._keys, prefix)
+        stop = min(start + limit, len(self._keys))
+        result = []
+        for i in range(start, stop):
+            if not self._keys[i].startswith(prefix):
+                break
+            result.append(self._names[i])
+        return result
+
+    def __contains__(self, name):
+        key = name.strip().lower()
+        i = bisect.bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
+
+    def has_unknown(self, names):
+        return any(name.strip() and name not in self for name in names)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return '<TagIndex ({} tags)>'.format(len(self))
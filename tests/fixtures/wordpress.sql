@@ -0,0 +1,52 @@
+-- A small WordPress site for tests/test_wp.py, loaded into SQLite
+-- over the tables of wp.Base.
+
+INSERT INTO wp_users (ID, user_login, user_pass, display_name) VALUES
+    (1, 'admin', '', 'Иван Петров');
+
+INSERT INTO wp_terms (term_id, name, slug) VALUES
+    (1, 'Семейное право', '%d1%81%d0%b5%d0%bc%d1%8c%d1%8f'),
+    (2, 'Алименты', 'alimenty'),
+    (3, 'Взыскание', 'vzyskanie'),
+    (4, 'Трудовое право', 'trudovoe-pravo'),
+    (5, 'Развод', 'razvod'),
+    (6, 'развод ', 'razvod-2'),
+    (7, 'Я', 'ya');
+
+INSERT INTO wp_term_taxonomy (term_taxonomy_id, term_id, taxonomy, description, parent) VALUES
+    (101, 1, 'category', 'Всё о семье', 0),
+    (102, 2, 'category', '', 1),
+    (103, 3, 'category', '', 2),
+    (104, 4, 'category', '', 0),
+    (105, 5, 'post_tag', '', 0),
+    (106, 6, 'post_tag', '', 0),
+    (107, 7, 'post_tag', '', 0);
+
+INSERT INTO wp_options (option_id, option_name, option_value) VALUES
+    (1, 'category_1_acf_cat_content', '<p>Семейные споры</p>');
+
+INSERT INTO wp_posts (ID, post_author, post_date_gmt, post_modified_gmt, post_title,
+                      post_name, post_content, post_status, post_type, menu_order) VALUES
+    (1, 1, '2016-01-01 10:00:00', '2016-02-01 10:00:00', 'Как подать на алименты',
+     'kak-podat-na-alimenty', '<p>Текст статьи</p>', 'publish', 'post', 0),
+    (2, 1, '2016-01-02 10:00:00', NULL, 'Контакты', '', '<p>Телефон</p>', 'publish', 'page', 1),
+    (3, 1, '2016-01-03 10:00:00', NULL, 'Как развестись?', '', '<p>Хочу развестись</p>',
+     'publish', 'question', 0),
+    (4, 1, '2016-01-04 10:00:00', NULL, 'Как развестись?', '', '<p>Повтор</p>',
+     'publish', 'question', 0),
+    (5, 1, '2016-01-05 10:00:00', NULL, 'Без рубрики', 'bez-rubriki', '<p>Текст</p>',
+     'publish', 'post', 0),
+    (6, 1, '2016-01-06 10:00:00', NULL, 'Черновик', 'chernovik', '<p>Текст</p>',
+     'draft', 'post', 0),
+    (7, 1, '2016-01-07 10:00:00', NULL, 'Увольнение по статье', 'uvolnenie', '<p>Текст</p>',
+     'publish', 'post', 0);
+
+INSERT INTO wp_term_relationships (object_id, term_taxonomy_id) VALUES
+    (1, 103), (1, 105), (1, 107),
+    (3, 101), (3, 106), (3, 107),
+    (4, 101),
+    (6, 104),
+    (7, 104), (7, 105);
+
+INSERT INTO wp_postmeta (meta_id, post_id, meta_key, meta_value) VALUES
+    (1, 3, 'answer', '<p>Через суд или ЗАГС</p>');
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Listings that render every page with its parents must run the same
+number of statements however many pages there are.
+
+    TEST_DATABASE_URL=postgresql:///jurist_test python -m unittest tests.test_query_counts
+
+The database is wiped with utils.init_db(), so never point it at real data.
+"""
+
+import os
+import unittest
+
+from flaskapp import app, db
+import models
+from synthetic_site import QueryCounter, build_site
+
+DATABASE = os.environ.get('TEST_DATABASE_URL')
+ROWS = 200
+
+
+@unittest.skipUnless(DATABASE, 'TEST_DATABASE_URL is not set')
+class QueryCountTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Has to be set before the engine is created on first use.
+        app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE
+
+    def count(self, rows, listing):
+        """
+        Statements run by ``listing()`` and by reading the parents of
+        what it returns, as the admin templates do, on a site of ``rows`` pages.
+        """
+        with app.test_request_context():
+            build_site(rows, 0)
+            counter = QueryCounter(db.engine)
+            try:
+                for page in listing():
+                    page.get_url()
+                    page.parent.heading
+                    if page.parent.parent is not None:
+                        page.parent.parent.heading
+            finally:
+                db.session.remove()
+                counter.stop()
+        return counter.count
+
+    def assertConstant(self, listing):
+        self.assertEqual(self.count(ROWS, listing), self.count(2 * ROWS, listing))
+
+    def test_sorted_services(self):
+        self.assertConstant(lambda: models.Page.get_sorted_pages('service'))
+
+    def test_sorted_papers(self):
+        self.assertConstant(lambda: models.Page.get_sorted_pages('paper'))
+
+    def test_categories(self):
+        self.assertConstant(lambda: [c.page for c in models.Category.get_all()])
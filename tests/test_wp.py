@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+WordPress import of the site in fixtures/wordpress.sql.
+
+    TEST_DATABASE_URL=postgresql:///jurist_test python -m unittest tests.test_wp
+
+The database is wiped with utils.init_db(), so never point it at real data.
+"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from flaskapp import app, db
+import models
+import utils
+import wp
+
+DATABASE = os.environ.get('TEST_DATABASE_URL')
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'wordpress.sql')
+
+
+def create_wordpress(path):
+    wpdb = wp.WordpressDB(None, None, None, url='sqlite:///' + path)
+    wp.Base.metadata.create_all(wpdb.engine)
+    with open(FIXTURE, encoding='utf-8') as f:
+        script = f.read()
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.executescript(script)
+    connection.close()
+    return wpdb
+
+
+@unittest.skipUnless(DATABASE, 'TEST_DATABASE_URL is not set')
+class ImporterTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Has to be set before the engine is created on first use.
+        app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.wpdb = create_wordpress(os.path.join(self.directory.name, 'wordpress.sqlite'))
+        self.context = app.test_request_context()
+        self.context.push()
+        utils.init_db()
+        models.Page.api_create({
+            'label': 'main', 'heading': u'Главная', 'kind': 'main',
+            'aux_field_1': u'Юрист', 'visible_in_menu': True,
+        })
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        self.wpdb.session.close()
+        self.directory.cleanup()
+
+    def test_import(self):
+        stats = wp.Importer(self.wpdb).run()
+        self.assertEqual(stats, {'categories': 4, 'tags': 1, 'pages': 3,
+                                 'questions': 1, 'skipped': 2})
+
+        Page = models.Page
+        family = db.session.query(Page).filter_by(heading=u'Семейное право').one()
+        self.assertEqual(family.kind, 'category')
+        self.assertEqual(family.label, 'semja')
+        self.assertEqual(family.content, u'<p>Семейные споры</p>')
+        # The third level is attached to its top-level category.
+        deep = db.session.query(Page).filter_by(heading=u'Взыскание').one()
+        self.assertEqual((deep.kind, deep.parent_id), ('subcategory', family.id))
+
+        paper = db.session.query(Page).filter_by(label='kak-podat-na-alimenty').one()
+        self.assertEqual((paper.kind, paper.parent_id), ('paper', deep.id))
+        self.assertEqual([tag.name for tag in paper.tags], [u'Развод'])
+
+        question = db.session.query(models.Question).one()
+        self.assertEqual(question.heading, u'Как развестись?')
+        self.assertEqual(question.parent_id, family.id)
+        self.assertEqual(question.author, u'Иван Петров')
+        self.assertEqual(question.content_answer, u'<p>Через суд или ЗАГС</p>')
+        # One-letter tags don't fit the tags table and are skipped.
+        self.assertEqual([tag.name for tag in question.tags], [u'Развод'])
+        self.assertEqual(models.QuestionStats.get().total, 1)
+
+    def test_no_jurist(self):
+        db.session.query(models.Jurist).delete()
+        db.session.commit()
+        with self.assertRaises(ValueError):
+            wp.Importer(self.wpdb).run()
+        self.assertEqual(db.session.query(models.Page).count(), 1)
@@ -25,24 +25,29 @@ def _postprocess_html(html):
     )
 
 
-def fix_all_pages():
+def rebuild_page_paths():
+    """
+    Fill materialized paths, ancestor ids and resolved aux fields
+    of all pages from parent links.
+    """
     db = models.db
     Page = models.Page
-    Question = models.Question
     try:
-        pages = db.session.query(Page).all()
-        for page in pages:
-            page.content = _postprocess_html(page.content)
-        db.session.commit()
-    except Exception:
-        db.session.rollback()
-        raise
-
-    try:
-        questions = db.session.query(Question).all()
-        for question in questions:
-            question.content_question = _postprocess_html(question.content_question)
-            question.content_answer = _postprocess_html(question.content_answer)
+        aux_columns = [getattr(Page, key) for key in models.AUX_FIELDS]
+        rows = db.session.query(Page.id, Page.label, Page.parent_id, *aux_columns).all()
+        children = {}
+        for row in rows:
+            children.setdefault(row.parent_id, []).append(row)
+
+        mappings = []
+        queue = [(row, None) for row in children.get(None, [])]
+        while queue:
+            row, parent = queue.pop()
+            node = Page._tree_fields(row.label, row[3:], parent)
+            node['id'] = row.id
+            mappings.append(node)
+            queue.extend((child, node) for child in children.get(row.id, []))
+        db.session.bulk_update_mappings(Page, mappings)
         db.session.commit()
     except Exception:
         db.session.rollback()
@@ -53,6 +58,7 @@ def init_db():
     db = models.db
     try:
         db.metadata.drop_all(bind=db.engine)
+        db.engine.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
         db.metadata.create_all(bind=db.engine)
 
         types = [
@@ -97,6 +103,7 @@ def init_db():
             face='face_1.png',
         ))
 
+        models.Question.refresh_listing()
         db.session.commit()
         print('Commited')
 
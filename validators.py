@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import hashlib
+from collections import namedtuple
+
+import arrow
+from flask import g, request, make_response
+
+from versions import EVERYTHING
+
+Validator = namedtuple('Validator', 'etag, last_modified')
+
+
+def build_validator(versions, key, tags, date_modified=None):
+    """
+    Strong validator of a response identified by ``key`` that depends on
+    content ``tags``. Any bump of a tag changes the ETag, and the time of
+    the latest bump counts as a modification of the response. The ``all``
+    tag is always included.
+    """
+    tags = sorted(set(tags) | {EVERYTHING})
+    stamps = versions.get_many(tags)
+    digest = hashlib.sha1()
+    for part in (key, tags, stamps, date_modified):
+        digest.update(repr(part).encode('utf-8'))
+
+    dates = [arrow.get(stamp[2] / 10 ** 9) for stamp in stamps if stamp[2]]
+    if date_modified is not None:
+        dates.append(date_modified)
+    last_modified = max(dates) if dates else None
+    return Validator(digest.hexdigest(), last_modified)
+
+
+def is_not_modified(validator):
+    if request.if_none_match:
+        return request.if_none_match.contains(validator.etag)
+    since = request.if_modified_since
+    if since is None or validator.last_modified is None:
+        return False
+    return validator.last_modified.replace(microsecond=0) <= arrow.get(since)
+
+
+def conditional(get_validator, max_age=None):
+    """
+    Answer conditional requests with 304 before the view loads anything.
+
+    ``get_validator`` receives the view arguments and returns a Validator,
+    or None when the request cannot be validated up front. The validator
+    is kept in ``g.validator`` so the rendered response carries it too.
+    ``max_age`` is sent in Cache-Control as the rendered response sends it.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if 'validator' in g or request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+            validator = get_validator(*args, **kwargs)
+            if validator is None:
+                return view(*args, **kwargs)
+            g.validator = validator
+            if not is_not_modified(validator):
+                return view(*args, **kwargs)
+            response = make_response('', 304)
+            response.set_etag(validator.etag)
+            if max_age is not None:
+                response.headers['Cache-Control'] = 'max-age={}'.format(max_age)
+            if validator.last_modified is not None:
+                response.last_modified = validator.last_modified.datetime
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+import uuid
+
+# Version every cached response and validator depends on, bumped
+# when content changed in bulk and nothing narrower applies.
+EVERYTHING = 'all'
+
+
+class VersionStore(object):
+    """
+    Named content versions shared by all worker processes.
+
+    Every version is a small file inside ``directory``. Bumping a version
+    atomically replaces its file, so other processes notice the change
+    with a single ``os.stat`` call and without touching the database.
+    If the file cannot be written, the error is logged and a
+    process-local counter still lets the process that made the change
+    see it; the change itself is already committed by then.
+    """
+
+    def __init__(self, directory, logger):
+        self.directory = directory
+        self.logger = logger
+        self._local = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name.replace(':', '-'))
+
+    def get(self, name):
+        local = self._local.get(name, 0)
+        try:
+            st = os.stat(self._path(name))
+        except OSError:
+            return (local, None, None)
+        return (local, st.st_ino, st.st_mtime_ns)
+
+    def get_many(self, names):
+        return tuple(self.get(name) for name in names)
+
+    def bump(self, *names):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for name in names:
+                path = self._path(name)
+                temporary = '{}.{}'.format(path, uuid.uuid4().hex)
+                with open(temporary, 'w') as f:
+                    f.write(temporary)
+                os.replace(temporary, path)
+        except OSError:
+            self.logger.exception(
+                'Could not bump {}, other processes keep their cached values.'
+                .format(', '.join(names)))
+            with self._lock:
+                for name in names:
+                    self._local[name] = self._local.get(name, 0) + 1
+
+
+class CachedSnapshot(object):
+    """
+    Process-wide value rebuilt by ``build()`` when its version changes.
+    ``name`` may also be a list of versions the value depends on.
+
+    If rebuilding fails (e.g. the database is briefly unavailable) the
+    last good value keeps being served and the rebuild is retried after
+    ``retry_seconds``.
+    """
+
+    def __init__(self, versions, name, build, logger, default=None,
+                 retry_seconds=5):
+        self.versions = versions
+        self.names = (name,) if isinstance(name, str) else tuple(name)
+        self.name = ', '.join(self.names)
+        self.build = build
+        self.logger = logger
+        self.retry_seconds = retry_seconds
+        self._value = default
+        self._version = None
+        self._failed_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        version = self.versions.get_many(self.names)
+        if version != self._version:
+            self._refresh(version)
+        return self._value
+
+    def invalidate(self):
+        self.versions.bump(*self.names)
+
+    def _refresh(self, version):
+        with self._lock:
+            if version == self._version:
+                return
+            now = time.monotonic()
+            if (self._failed_at is not None and
+                    now - self._failed_at < self.retry_seconds):
+                return
+            try:
+                value = self.build()
+            except Exception:
+                self.logger.exception(
+                    'Could not rebuild {}, serving previous value.'.format(self.name))
+                self._failed_at = now
+                return
+            self._value = value
+            self._version = version
+            self._failed_at = None
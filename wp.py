@@ -1,9 +1,23 @@
+import argparse
 import subprocess
 import os
+from collections import Counter, namedtuple
+from urllib.parse import unquote
 
-from sqlalchemy import create_engine, Column, String, Integer, ForeignKey, Unicode, UnicodeText
+import arrow
+from sqlalchemy import (
+    create_engine, Column, String, Integer, ForeignKey, Unicode, UnicodeText, DateTime,
+    cast, literal, text, func,
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, scoped_session
+from sqlalchemy.orm.exc import NoResultFound
+
+import flaskapp
+from flaskapp import db
+import models
+import rewriter
+import utils
 
 # These are default MAMP settings (except for MYSQL_PORT):
 MYSQL_PATH = '/Applications/MAMP/Library/bin/'
@@ -11,6 +25,16 @@ ROOT_USER = 'root'
 ROOT_PASSWORD = 'root'
 MYSQL_PORT = 3306
 
+BATCH_SIZE = 1000
+# WordPress post types imported as pages and the kind they get.
+PAGE_POST_TYPES = {
+    'post': 'paper',
+    'page': 'static',
+}
+QUESTION_POST_TYPE = 'question'
+# Post meta holding the answer to a question.
+ANSWER_META_KEY = 'answer'
+
 # This hash corresponds to password 'admin'.
 # Generated by
 # http://scriptserver.mainframe8.com/wordpress_password_hasher.php
@@ -31,6 +55,7 @@ class User(Base):
     ID = Column(Integer, primary_key=True)
     user_login = Column(String)
     user_pass = Column(String)
+    display_name = Column(String)
 
 
 class Term(Base):
@@ -46,11 +71,41 @@ class TermTaxonomy(Base):
     term_taxonomy_id = Column(Integer, primary_key=True)
     term_id = Column(Integer, ForeignKey('wp_terms.term_id'))
     taxonomy = Column(String)
+    description = Column(String)
     parent = Column(Integer)
 
 
+class TermRelationship(Base):
+    __tablename__ = 'wp_term_relationships'
+    object_id = Column(Integer, primary_key=True)
+    term_taxonomy_id = Column(Integer, ForeignKey('wp_term_taxonomy.term_taxonomy_id'),
+                              primary_key=True)
+
+
+class Post(Base):
+    __tablename__ = 'wp_posts'
+    ID = Column(Integer, primary_key=True)
+    post_author = Column(Integer)
+    post_date_gmt = Column(DateTime)
+    post_modified_gmt = Column(DateTime)
+    post_title = Column(String)
+    post_name = Column(String)
+    post_content = Column(String)
+    post_status = Column(String)
+    post_type = Column(String)
+    menu_order = Column(Integer)
+
+
+class PostMeta(Base):
+    __tablename__ = 'wp_postmeta'
+    meta_id = Column(Integer, primary_key=True)
+    post_id = Column(Integer)
+    meta_key = Column(String)
+    meta_value = Column(String)
+
+
 class WordpressDB(object):
-    def __init__(self, user, password, database):
+    def __init__(self, user, password, database, url=None):
         self.data = {
             'root_user': ROOT_USER,
             'root_password': ROOT_PASSWORD,
@@ -60,9 +115,11 @@ class WordpressDB(object):
             'host': 'localhost',
             'port': MYSQL_PORT,
         }
-        self.engine = create_engine(
+        # Any other database with WordPress tables (e.g. an SQLite
+        # fixture) can be read by passing its ``url``.
+        self.engine = create_engine(url or (
             'mysql+mysqlconnector://'
-            '{root_user}:{root_password}@{host}:{port}/{database}'.format(**self.data))
+            '{root_user}:{root_password}@{host}:{port}/{database}'.format(**self.data)))
 
         session_factory = sessionmaker(bind=self.engine)
         Session = scoped_session(session_factory)
@@ -102,14 +159,309 @@ class WordpressDB(object):
         return q.all()
 
     def get_all_categories(self):
-        categories = (self.session.query(Term).
-            join(TermTaxonomy).filter(TermTaxonomy.taxonomy == 'category').all())
-        ids = self.session.query(TermTaxonomy).filter_by(taxonomy='category').all()
-        for c in categories:
-            c.parent = None
-            parent = self.session.query(TermTaxonomy).filter_by(term_id=c.term_id).one().parent
-            c.parent = parent if parent != 0 else None
-            name = 'category_{}_acf_cat_content'.format(c.term_id)
-            content = self.session.query(Option).filter_by(option_name=name).first()
-            c.content = None if content is None else content.option_value
+        """
+        Category terms with ``parent`` (a term id or None) and ``content``
+        (from the ACF option) set, in one query.
+        """
+        content_option = (literal('category_') + cast(Term.term_id, String) +
+                          literal('_acf_cat_content'))
+        rows = (self.session.query(Term, TermTaxonomy.parent, TermTaxonomy.description,
+                                   Option.option_value)
+                .join(TermTaxonomy, TermTaxonomy.term_id == Term.term_id)
+                .outerjoin(Option, Option.option_name == content_option)
+                .filter(TermTaxonomy.taxonomy == 'category')
+                .order_by(Term.term_id).all())
+        categories = []
+        for c, parent, description, content in rows:
+            c.parent = parent or None
+            c.description = description
+            c.content = content
+            categories.append(c)
         return categories
+
+    def get_term_relationships(self, taxonomies=('category', 'post_tag')):
+        """
+        ``{post id: {taxonomy: [(term id, term name)]}}`` in one query.
+        """
+        rows = (self.session.query(TermRelationship.object_id, TermTaxonomy.taxonomy,
+                                   Term.term_id, Term.name)
+                .join(TermTaxonomy,
+                      TermTaxonomy.term_taxonomy_id == TermRelationship.term_taxonomy_id)
+                .join(Term, Term.term_id == TermTaxonomy.term_id)
+                .filter(TermTaxonomy.taxonomy.in_(taxonomies))
+                .order_by(TermRelationship.object_id, Term.term_id))
+        relations = {}
+        for post_id, taxonomy, term_id, name in rows:
+            terms = relations.setdefault(post_id, {})
+            terms.setdefault(taxonomy, []).append((term_id, name))
+        return relations
+
+    def get_post_meta(self, key):
+        rows = (self.session.query(PostMeta.post_id, PostMeta.meta_value)
+                .filter(PostMeta.meta_key == key))
+        return dict(rows)
+
+    def iter_posts(self, post_types, batch_size=BATCH_SIZE):
+        """
+        Published posts of the given types with their author's name,
+        streamed in id order.
+        """
+        return (self.session.query(Post.ID, Post.post_type, Post.post_title, Post.post_name,
+                                   Post.post_content, Post.menu_order, Post.post_date_gmt,
+                                   Post.post_modified_gmt, User.display_name)
+                .outerjoin(User, User.ID == Post.post_author)
+                .filter(Post.post_status == 'publish')
+                .filter(Post.post_type.in_(post_types))
+                .order_by(Post.ID)
+                .yield_per(batch_size))
+
+
+Node = namedtuple('Node', 'id, kind, tree')
+
+
+def _timestamp(value):
+    # WordPress stores GMT times without a zone, and zeroes for unknown ones.
+    return arrow.get(value) if value else arrow.utcnow()
+
+
+class Importer(object):
+    """
+    Copies categories, posts and tags of a WordpressDB into the CMS.
+
+    Categories become category pages (nested ones subcategory pages under
+    their top-level category), posts become pages of PAGE_POST_TYPES kinds
+    and questions. Posts that don't fit (no category, no title, a repeated
+    question) are skipped. Rows are inserted in batches with multi-row statements
+    and ids taken from the sequences beforehand, so the whole import costs
+    a few statements per BATCH_SIZE posts. Everything is written in a
+    single transaction.
+    """
+
+    def __init__(self, wpdb, batch_size=BATCH_SIZE):
+        self.wpdb = wpdb
+        self.batch_size = batch_size
+        self.stats = Counter()
+
+    def run(self):
+        try:
+            self._prepare()
+            self._import_categories()
+            relations = self.wpdb.get_term_relationships()
+            self._resolve_tags(relations)
+            answers = self.wpdb.get_post_meta(ANSWER_META_KEY)
+
+            pages, questions = [], []
+            post_types = list(PAGE_POST_TYPES) + [QUESTION_POST_TYPE]
+            for post in self.wpdb.iter_posts(post_types, self.batch_size):
+                terms = relations.get(post.ID, {})
+                if post.post_type == QUESTION_POST_TYPE:
+                    questions.append((post, terms, answers.get(post.ID) or ''))
+                else:
+                    pages.append((post, terms))
+                if len(pages) + len(questions) >= self.batch_size:
+                    self._insert_pages(pages)
+                    self._insert_questions(questions)
+                    pages, questions = [], []
+            self._insert_pages(pages)
+            self._insert_questions(questions)
+
+            models.Question.refresh_listing()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return self.stats
+
+    def _prepare(self):
+        try:
+            main = models.Page.get_main()
+        except NoResultFound:
+            raise ValueError('The main page has to be created before the import.')
+        self.main = Node(main.id, main.kind, main.tree_node())
+        self.labels = {label for label, in db.session.query(models.Page.label)}
+        self.headings = {heading for heading, in db.session.query(models.Question.heading)}
+        self.jurist_id = db.session.query(func.min(models.Jurist.id)).scalar()
+        if self.jurist_id is None:
+            raise ValueError('A jurist has to be created before the import.')
+        self.categories = {}
+
+    def _allocate_ids(self, table, count):
+        if not count:
+            return []
+        rows = db.session.execute(
+            text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                 "FROM generate_series(1, :count)"),
+            {'table': table.name, 'count': count})
+        return [id for id, in rows]
+
+    def _pick_label(self, slug, name, fallback):
+        for source in (unquote(slug or ''), name or ''):
+            candidate = models.Page.make_label(source)
+            if models.LABEL_REGEX_COMPILED.fullmatch(candidate):
+                break
+        else:
+            candidate = fallback
+        label, number = candidate, 0
+        while label in self.labels or label == 'main':
+            number += 1
+            label = '{}-{}'.format(candidate, number)
+        self.labels.add(label)
+        return label
+
+    def _page_row(self, id, label, heading, content, kind, parent,
+                  priority=0, description='', created=None, modified=None):
+        fields = models.Page._tree_fields(label, [''] * len(models.AUX_FIELDS), parent.tree)
+        row = {
+            'id': id,
+            'label': label,
+            'heading': heading,
+            'title': '',
+            'description': description or '',
+            'content': utils._postprocess_html(content or ''),
+            'kind': kind,
+            'priority': priority or 0,
+            'visible_in_menu': True,
+            'parent_id': parent.id,
+            'parent_kind': parent.kind,
+            # Filled in after the import by rewriter.py.
+            'has_visible_content': False,
+            'date_created': _timestamp(created),
+            'date_modified': _timestamp(modified),
+        }
+        for key in models.AUX_FIELDS:
+            row[key] = ''
+        row.update(fields)
+        return row
+
+    def _insert(self, table, rows):
+        for start in range(0, len(rows), self.batch_size):
+            db.session.execute(table.insert().values(rows[start:start + self.batch_size]))
+
+    def _import_categories(self):
+        categories = self.wpdb.get_all_categories()
+        by_id = {c.term_id: c for c in categories}
+
+        def top_level(c):
+            seen = set()
+            while c.parent in by_id and c.term_id not in seen:
+                seen.add(c.term_id)
+                c = by_id[c.parent]
+            return c
+
+        # Only two levels fit the CMS: deeper categories are attached
+        # to their top-level ancestor.
+        top = [c for c in categories if top_level(c) is c]
+        nested = [c for c in categories if top_level(c) is not c]
+        rows = []
+        for group, kind in ((top, 'category'), (nested, 'subcategory')):
+            ids = self._allocate_ids(models.Page.__table__, len(group))
+            for id, c in zip(ids, group):
+                parent = self.main if kind == 'category' else self.categories[top_level(c).term_id]
+                label = self._pick_label(c.slug, c.name, 'category-{}'.format(c.term_id))
+                row = self._page_row(id, label, c.name, c.content, kind, parent,
+                                     description=c.description)
+                self.categories[c.term_id] = Node(id, kind, dict(row))
+                rows.append(row)
+        self._insert(models.Page.__table__, rows)
+        self.stats['categories'] += len(rows)
+
+    def _resolve_tags(self, relations):
+        names = {name for terms in relations.values()
+                 for _, name in terms.get('post_tag', [])}
+        names = models.Tag.normalize_names(sorted(names))
+        # Tag names have to be longer than one character.
+        short = [name for name in names if len(name) < 2]
+        if short:
+            flaskapp.app.logger.warning(
+                'Skipping WordPress tags: {}'.format(', '.join(short)))
+        names = [name for name in names if len(name) > 1]
+        self.tag_ids = {}
+        for start in range(0, len(names), self.batch_size):
+            for tag in models.Tag.resolve(names[start:start + self.batch_size]):
+                self.tag_ids[tag.name.lower()] = tag.id
+        self.stats['tags'] += len(names)
+
+    def _tag_links(self, key, id, terms):
+        tag_ids = {self.tag_ids[name.strip().lower()]
+                   for _, name in terms.get('post_tag', [])
+                   if name.strip().lower() in self.tag_ids}
+        return [{key: id, 'tag_id': tag_id} for tag_id in sorted(tag_ids)]
+
+    def _category(self, terms):
+        """
+        Page of the post's first category, None if it has none.
+        """
+        for term_id, _ in terms.get('category', []):
+            if term_id in self.categories:
+                return self.categories[term_id]
+        return None
+
+    def _insert_pages(self, posts):
+        ids = self._allocate_ids(models.Page.__table__, len(posts))
+        rows, links = [], []
+        for id, (post, terms) in zip(ids, posts):
+            kind = PAGE_POST_TYPES[post.post_type]
+            parent = self.main if kind == 'static' else self._category(terms)
+            heading = (post.post_title or '').strip()
+            if parent is None or not heading:
+                self.stats['skipped'] += 1
+                continue
+            label = self._pick_label(post.post_name, heading, 'page-{}'.format(post.ID))
+            rows.append(self._page_row(
+                id, label, heading, post.post_content, kind, parent,
+                priority=post.menu_order, created=post.post_date_gmt,
+                modified=post.post_modified_gmt))
+            links.extend(self._tag_links('page_id', id, terms))
+        self._insert(models.Page.__table__, rows)
+        self._insert(models.pages_and_tags_table, links)
+        self.stats['pages'] += len(rows)
+
+    def _insert_questions(self, posts):
+        ids = self._allocate_ids(models.Question.__table__, len(posts))
+        rows, links = [], []
+        for id, (post, terms, answer) in zip(ids, posts):
+            heading = (post.post_title or '').strip()
+            parent = self._category(terms)
+            if parent is None or len(heading) <= 2 or heading in self.headings:
+                self.stats['skipped'] += 1
+                continue
+            self.headings.add(heading)
+            rows.append({
+                'id': id,
+                'parent_id': parent.id,
+                'jurist_id': self.jurist_id,
+                'heading': heading,
+                'content_question': utils._postprocess_html(post.post_content or ''),
+                'content_answer': utils._postprocess_html(answer),
+                'author': post.display_name or '',
+                # Filled in after the import by rewriter.py.
+                'description': '',
+                'date_created': _timestamp(post.post_date_gmt),
+                'date_modified': _timestamp(post.post_modified_gmt),
+            })
+            links.extend(self._tag_links('question_id', id, terms))
+        self._insert(models.Question.__table__, rows)
+        self._insert(models.questions_and_tags_table, links)
+        self.stats['questions'] += len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a WordPress database into the CMS.')
+    parser.add_argument('url', help='SQLAlchemy URL of the WordPress database, '
+                                    'e.g. sqlite:///wordpress.sqlite')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    wpdb = WordpressDB(None, None, None, url=args.url)
+    with flaskapp.app.app_context():
+        stats = Importer(wpdb, batch_size=args.batch_size).run()
+        # Visible content and descriptions take parsing HTML,
+        # which the rewriter does in parallel.
+        rewriter.rewrite(['visibility', 'description'], restart=True)
+        flaskapp.tag_index.invalidate()
+    for key in ('categories', 'pages', 'questions', 'tags', 'skipped'):
+        print('{}: {}'.format(key, stats[key]))
+
+
+if __name__ == '__main__':
+    main()